@@ -5,12 +5,28 @@ Combines Claude Usage + Portfolio Tracker into a single server
 Created by Eli Gorelick - eligorelick.com
 """
 
-from flask import Flask, jsonify
+from flask import Flask, Response, g, request
 from curl_cffi import requests as curl_requests
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import random
+import struct
 import threading
 import time
-from datetime import datetime
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import partial
+import numpy as np
+import pandas as pd
 import yfinance as yf
+from yfinance.data import YfData
 
 app = Flask(__name__)
 
@@ -55,329 +71,2688 @@ HOLDINGS = {
 
 CASH = 500.00            # Demo: Cash balance
 MONEY_MARKET = 2500.00   # Demo: Money market balance (e.g., SWVXX at $1.00)
+
+# Other accounts (IRA, a partner's brokerage...) served as /portfolio/<name>,
+# /chart/<name> and /all/<name>; the portfolio above is also /portfolio/main.
+# A symbol held in several accounts is still only fetched once per cycle.
+PORTFOLIOS = {
+    # "ira": {
+    #     "holdings": {"VTI": {"shares": 25, "cost_per_share": 180.00}},
+    #     "cash": 0.00,
+    #     "money_market": 1000.00,
+    # },
+}
+DEFAULT_PORTFOLIO = "main"  # Name of HOLDINGS/CASH/MONEY_MARKET under /portfolio/<name>
+
+# If this file exists it is used instead of the settings above, and re-read
+# whenever it is saved (no restart): {"holdings": {...}, "cash": 500.00,
+# "money_market": 2500.00, "portfolios": {...}} in the formats above. Only
+# symbols it adds are fetched; the rest are re-valued from cached quotes and bars.
+# Deleting it goes back to the settings above.
+HOLDINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "holdings.json")
+HOLDINGS_CHECK_INTERVAL = 2  # Seconds between checks of HOLDINGS_FILE for changes
 # ============================================================
 
 # Fetch intervals (in seconds)
-CLAUDE_FETCH_INTERVAL = 600   # 10 minutes
-PORTFOLIO_FETCH_INTERVAL = 600  # 10 minutes
-
-# Data caches
-claude_data = {"status": "starting"}
-portfolio_cache = {
-    "holdings": None,
-    "chart_data": None,
-    "last_update": None
+CLAUDE_FETCH_INTERVAL = 600   # 10 minutes (portfolio fetches follow REFRESH_INTERVALS)
+
+# Claude polling. The interval above is the baseline: polls speed up while
+# 5-hour usage is climbing and slow down while it is flat.
+# CLAUDE_USAGE_URL can point at a local fake usage endpoint for testing.
+CLAUDE_USAGE_URL = f"https://claude.ai/api/organizations/{ORG_ID}/usage"
+CLAUDE_MIN_INTERVAL = 60     # Fastest polling, while usage is climbing
+CLAUDE_MAX_INTERVAL = 1800   # Slowest polling, while usage is flat
+CLAUDE_BACKOFF_MAX = 3600    # Longest wait after repeated failures
+CLAUDE_RESET_GRACE = 5       # Seconds after a cached resets_at to poll again
+CLAUDE_TIMEOUT = 20          # Seconds to wait for the usage endpoint
+
+# Usage history (/usage/history, /usage/forecast), kept across restarts in USAGE_LOG_FILE
+USAGE_LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage_history.jsonl")
+USAGE_HISTORY_SIZE = 2016     # Samples kept in memory (a week of 5-minute polls)
+USAGE_HISTORY_BUCKETS = 672   # /usage/history points (a week of 15-minute buckets)
+USAGE_BUCKET_SECONDS = 900    # /usage/history resolution
+USAGE_FORECAST_WINDOW = 3600  # Seconds of samples behind each /usage/forecast trend
+
+# Quote fetching
+# QUOTE_URL can point at a local stub serving canned Yahoo-style quote JSON
+QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+QUOTE_BATCH_SIZE = 50    # Symbols per bulk quote request
+HISTORY_BATCH_SIZE = 20  # Symbols per intraday history download
+FETCH_WORKERS = 8        # Max Yahoo requests in flight at once
+FETCH_TIMEOUT = 20       # Seconds to wait on a symbol before publishing it as stale
+MARKET_TIMEZONE = "America/New_York"  # Exchange timezone, used to detect a new trading day
+
+# Refresh schedule. Sessions are HH:MM ranges in MARKET_TIMEZONE on trading
+# days; weekends, MARKET_HOLIDAYS and the hours outside these are "closed".
+MARKET_SESSIONS = {
+    "pre_market": ("04:00", "09:30"),
+    "regular": ("09:30", "16:00"),
+    "after_hours": ("16:00", "20:00"),
+}
+REFRESH_INTERVALS = {    # Seconds between fetches in each phase
+    "pre_market": 300,
+    "regular": 60,
+    "after_hours": 300,
+    "closed": 1800,
 }
+MARKET_HOLIDAYS = {      # NYSE full-day closures
+    "2025-01-01", "2025-01-09", "2025-01-20", "2025-02-17", "2025-04-18", "2025-05-26",
+    "2025-06-19", "2025-07-04", "2025-09-01", "2025-11-27", "2025-12-25",
+    "2026-01-01", "2026-01-19", "2026-02-16", "2026-04-03", "2026-05-25",
+    "2026-06-19", "2026-07-03", "2026-09-07", "2026-11-26", "2026-12-25",
+    "2027-01-01", "2027-01-18", "2027-02-15", "2027-03-26", "2027-05-31",
+    "2027-06-18", "2027-07-05", "2027-09-06", "2027-11-25", "2027-12-24",
+}
+BACKOFF_MAX = 1800       # Longest wait after repeated failures
+RATE_LIMIT_BACKOFF = 300  # Minimum first wait after Yahoo answers HTTP 429
+
+# Metrics (/metrics): histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)  # Bytes
+
+# Live updates (/stream)
+STREAM_HEARTBEAT = 15    # Seconds between keep-alive comments on idle streams
+STREAM_HISTORY = 50      # Events kept for Last-Event-ID resume
+STREAM_RETRY_MS = 5000   # How long EventSource clients wait before reconnecting
+
+# Response compression
+GZIP_LEVEL = 6           # 1-9; 9 takes ~4x as long to publish for ~3% smaller bodies
+
+# Delta responses (/portfolio?since=VERSION)
+DELTA_HISTORY = 20       # Past versions a delta can be built against before clients get the full payload
+
+# Chart downsampling (/chart?points=N or /chart?width=PIXELS)
+MAX_CHART_POINTS = 2000  # Largest point count a client can ask for
+CHART_CACHE_SIZE = 64    # Chart and delta variants kept per data version, least recently used dropped
+
+# Multi-day charts (/chart?range=1W|1M|1Y|5Y): bar interval and days covered.
+# Closed bars are kept in HISTORY_DIR, so only new ones are downloaded.
+CHART_RANGES = {
+    "1W": ("30m", 7),
+    "1M": ("1h", 31),
+    "1Y": ("1d", 366),
+    "5Y": ("1d", 5 * 366),
+}
+INTERVAL_SECONDS = {"30m": 1800, "1h": 3600, "1d": 86400}
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_history")
+
+# Last published data is saved here and served (marked stale) right after a restart
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard_snapshot.json.gz")
+
+# Source engine: Claude and portfolio fetches share one asyncio event loop
+SOURCE_CONCURRENCY = 4   # Fetches in flight at once across all sources
+SOURCE_WORKERS = 4       # Threads for sources whose fetch is a blocking function
+SOURCE_RETRY_DELAY = 5   # Seconds before the first quick retry after an error or timeout
+PORTFOLIO_TIMEOUT = 120  # Seconds a whole portfolio refresh may take
+REFRESH_MIN_SPACING = 30  # Seconds a POST /refresh must wait after the last portfolio fetch started
+REFRESH_WAIT = 60        # Seconds a POST /refresh waits for its fetch before answering 503
+
+
+class PayloadCache:
+    """A small LRU of payloads built on request, such as /chart variants and deltas
+
+    Clients pick the point count, range, format and since version, so the
+    number of variants per snapshot is open-ended; the least recently used
+    beyond CHART_CACHE_SIZE are dropped and rebuilt if asked for again.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or CHART_CACHE_SIZE
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            payload = self.items.get(key)
+            if payload is not None:
+                self.items.move_to_end(key)
+            return payload
+
+    def __setitem__(self, key, payload):
+        with self.lock:
+            self.items[key] = payload
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+# Published data. Fetchers build a new immutable Snapshot (including the
+# pre-serialized endpoint bodies) and swap it in with a single assignment, so
+# each request reads one consistent view without taking a lock. portfolio_bases
+# maps recent portfolio versions to what ?since= deltas are built against. The
+# portfolio fields are the default portfolio's; portfolios holds a Snapshot
+# (only its portfolio fields used) per PORTFOLIOS account.
+Snapshot = namedtuple("Snapshot", [
+    "claude", "claude_history", "claude_forecast", "claude_version", "claude_update", "claude_stale",
+    "holdings", "chart", "history", "portfolio_version", "last_update", "portfolio_stale", "portfolio_bases",
+    "portfolios", "responses", "chart_sizes",
+])
+EMPTY_SNAPSHOT = Snapshot(
+    claude={"status": "starting"}, claude_history={}, claude_forecast={},
+    claude_version=0, claude_update=None, claude_stale=False,
+    holdings=None, chart=None, history={}, portfolio_version=0, last_update=None, portfolio_stale=False,
+    portfolio_bases={}, portfolios={}, responses={}, chart_sizes=PayloadCache(),
+)
+snapshot = EMPTY_SNAPSHOT
+publish_lock = threading.Lock()  # Serializes publishers only, never requests
+
+# Last good quotes, reused for symbols that miss a deadline
+last_price_data = {}
+# Symbols the last fetch served from last_price_data
+stale_quotes = set()
+
+# Held by each fetch cycle and holdings reload, so one never sees the other's accounts half switched
+portfolio_lock = threading.RLock()
+
+# Bounded worker pool shared by all quote and history requests
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+# Set when any Yahoo request in the current fetch was rate limited (HTTP 429)
+rate_limited = threading.Event()
+
+
+class Metrics:
+    """Counters, gauges and histograms for /metrics, in Prometheus text format
+
+    Recording is a dict lookup and a few additions under one lock, cheap
+    enough for every request. Labels are keyword arguments; each call site
+    should pass them in the same order.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        """Declare a metric: kind is "counter", "gauge" or "histogram" (with buckets)"""
+        self.families[name] = (kind, help_text, buckets, {})
+
+    def inc(self, name, amount=1, **labels):
+        series = self.families[name][3]
+        key = tuple(labels.items())
+        with self.lock:
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        series = self.families[name][3]
+        with self.lock:
+            series[tuple(labels.items())] = value
+
+    def observe(self, name, value, **labels):
+        _, _, buckets, series = self.families[name]
+        key = tuple(labels.items())
+        with self.lock:
+            counts = series.get(key)
+            if counts is None:
+                # Per-bucket counts, then the +Inf bucket, then the sum
+                counts = series[key] = [0] * (len(buckets) + 2)
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self):
+        """All metrics as Prometheus text exposition format bytes"""
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, buckets, series) in self.families.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series.items()):
+                    labels = ",".join(f'{k}="{_escape_label(v)}"' for k, v in key)
+                    if kind != "histogram":
+                        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+                        continue
+                    prefix = labels + "," if labels else ""
+                    total = 0
+                    for bound, count in zip(list(buckets) + ["+Inf"], value):
+                        total += count
+                        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {total}')
+                    lines.append(f"{name}_sum{{{labels}}} {value[-1]}")
+                    lines.append(f"{name}_count{{{labels}}} {total}")
+        return ("\n".join(lines) + "\n").encode()
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def error_status(error):
+    """Label for an upstream failure: its HTTP status code, "timeout" or "error\""""
+    response = getattr(error, "response", None)
+    code = getattr(error, "code", None) or getattr(response, "status_code", None)
+    if isinstance(code, int):
+        return str(code)
+    if is_rate_limited(error):
+        return "429"
+    if isinstance(error, TimeoutError) or "timed out" in str(error).lower():
+        return "timeout"
+    return "error"
+
+
+metrics = Metrics()
+metrics.describe("upstream_fetch_seconds", "histogram",
+                 "Yahoo request latency per symbol, by stage (quote, intraday, history)", LATENCY_BUCKETS)
+metrics.describe("upstream_errors_total", "counter", "Failed upstream requests by upstream and status code")
+metrics.describe("refresh_duration_seconds", "histogram", "Duration of a whole refresh by source", LATENCY_BUCKETS)
+metrics.describe("refresh_last_success_timestamp_seconds", "gauge", "Unix time of the last successful refresh by source")
+metrics.describe("http_requests_total", "counter", "Requests served by endpoint and status")
+metrics.describe("http_request_duration_seconds", "histogram", "Request latency by endpoint", LATENCY_BUCKETS)
+metrics.describe("http_response_bytes", "histogram", "Response body size by endpoint", SIZE_BUCKETS)
+
+
+def timed(task, stage, symbols):
+    """Wrap a fetch task to record its latency against each symbol it covers"""
+    def run():
+        start = time.perf_counter()
+        try:
+            return task()
+        finally:
+            elapsed = time.perf_counter() - start
+            for symbol in symbols:
+                metrics.observe("upstream_fetch_seconds", elapsed, stage=stage, symbol=symbol)
+    return run
 
 
 # ============================================================
 #                    CLAUDE USAGE FUNCTIONS
 # ============================================================
 
-def fetch_claude_usage_loop():
-    """Background thread that continuously fetches Claude usage data"""
-    global claude_data
+class UsagePoller:
+    """Polls the Claude usage endpoint over one long-lived HTTP session
 
-    print("\n" + "="*50)
-    print("Starting Claude usage fetcher...")
-    print("="*50 + "\n")
+    The curl_cffi session keeps its connection (and Chrome impersonation)
+    alive between polls and sends If-None-Match, so an unchanged payload can
+    come back as a bodyless 304. After each poll next_delay() picks the wait:
 
-    while True:
-        try:
-            timestamp = time.strftime('%H:%M:%S')
-            print(f"[{timestamp}] Fetching Claude usage...")
-
-            response = curl_requests.get(
-                f"https://claude.ai/api/organizations/{ORG_ID}/usage",
-                headers={
-                    "Cookie": f"sessionKey={SESSION_KEY}",
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                    "Accept": "application/json",
-                },
-                impersonate="chrome"
-            )
+    - five_hour utilization climbing: often enough to see ~4 polls before
+      it would reach 100% at the current rate (not below CLAUDE_MIN_INTERVAL)
+    - flat: 1.5x longer each time, up to CLAUDE_MAX_INTERVAL
+    - failure (401/403/5xx/network): exponential backoff with jitter
+    - never past a cached resets_at time, so a reset shows up right away
+    """
 
-            if response.status_code == 200:
-                claude_data = response.json()
-                five_hour = claude_data.get('five_hour', {}).get('utilization', 'N/A')
-                seven_day = claude_data.get('seven_day', {}).get('utilization', 'N/A')
-                sonnet = claude_data.get('seven_day_sonnet', {}).get('utilization', 'N/A')
-                print(f"[{timestamp}] Claude: 5-Hour: {five_hour}% | 7-Day: {seven_day}% | Sonnet: {sonnet}%")
-            elif response.status_code == 401:
-                print(f"[{timestamp}] Claude ERROR: Session expired")
-                claude_data = {"error": "Session expired - update SESSION_KEY"}
-            elif response.status_code == 403:
-                print(f"[{timestamp}] Claude ERROR: Access denied")
-                claude_data = {"error": "Access denied - check credentials"}
-            else:
-                print(f"[{timestamp}] Claude ERROR: HTTP {response.status_code}")
-                claude_data = {"error": f"HTTP {response.status_code}"}
+    WINDOWS = ("five_hour", "seven_day", "seven_day_sonnet")
+
+    def __init__(self, url, session_key, base_interval):
+        self.url = url
+        self.session_key = session_key
+        self.base_interval = base_interval
+        self.interval = base_interval
+        self.session = None
+        self.etag = None
+        self.data = None
+        self.last_sample = None  # (time, five_hour utilization)
+        self.resets = {}         # window -> resets_at as epoch seconds
+        self.failures = 0
+
+    def _open_session(self):
+        session = curl_requests.Session(impersonate="chrome")
+        session.headers.update({
+            "Cookie": f"sessionKey={self.session_key}",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Accept": "application/json",
+        })
+        return session
+
+    def _close_session(self):
+        if self.session is not None:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+            self.session = None
+
+    def poll(self):
+        """Fetch usage once
+
+        Returns:
+            The usage dict (the previous one on 304), or {"error": message}
+        """
+        timestamp = time.strftime('%H:%M:%S')
+        print(f"[{timestamp}] Fetching Claude usage...")
 
+        try:
+            if self.session is None:
+                self.session = self._open_session()
+            headers = {"If-None-Match": self.etag} if self.etag else {}
+            response = self.session.get(self.url, headers=headers, timeout=CLAUDE_TIMEOUT)
+            claude_data = response.json() if response.status_code == 200 else None
+            if response.status_code == 200 and not isinstance(claude_data, dict):
+                raise ValueError(f"Unexpected response body: {type(claude_data).__name__}")
         except Exception as e:
-            timestamp = time.strftime('%H:%M:%S')
             print(f"[{timestamp}] Claude ERROR: {e}")
-            claude_data = {"error": str(e)}
+            metrics.inc("upstream_errors_total", upstream="claude", status=error_status(e))
+            # Start over with a fresh connection next time
+            self._close_session()
+            self.failures += 1
+            return {"error": str(e)}
+
+        if response.status_code == 304 and self.data is not None:
+            print(f"[{timestamp}] Claude: unchanged")
+            self._record(self.data)
+            return self.data
+
+        if response.status_code == 200:
+            self.etag = response.headers.get("ETag")
+            self._record(claude_data)
+            five_hour = (claude_data.get('five_hour') or {}).get('utilization', 'N/A')
+            seven_day = (claude_data.get('seven_day') or {}).get('utilization', 'N/A')
+            sonnet = (claude_data.get('seven_day_sonnet') or {}).get('utilization', 'N/A')
+            print(f"[{timestamp}] Claude: 5-Hour: {five_hour}% | 7-Day: {seven_day}% | Sonnet: {sonnet}%")
+            return claude_data
+
+        self.failures += 1
+        metrics.inc("upstream_errors_total", upstream="claude", status=str(response.status_code))
+        if response.status_code == 401:
+            print(f"[{timestamp}] Claude ERROR: Session expired")
+            return {"error": "Session expired - update SESSION_KEY"}
+        if response.status_code == 403:
+            print(f"[{timestamp}] Claude ERROR: Access denied")
+            return {"error": "Access denied - check credentials"}
+        print(f"[{timestamp}] Claude ERROR: HTTP {response.status_code}")
+        return {"error": f"HTTP {response.status_code}"}
+
+    def _record(self, data):
+        """Update the adaptive interval and cached reset times from a good response"""
+        now = time.time()
+        self.data = data
+        self.failures = 0
+
+        for window in self.WINDOWS:
+            resets_at = (data.get(window) or {}).get("resets_at")
+            try:
+                self.resets[window] = datetime.fromisoformat(resets_at.replace("Z", "+00:00")).timestamp()
+            except (AttributeError, ValueError):
+                self.resets.pop(window, None)
+
+        utilization = (data.get("five_hour") or {}).get("utilization")
+        if not isinstance(utilization, (int, float)):
+            self.interval = self.base_interval
+            return
+
+        if self.last_sample is not None and now > self.last_sample[0]:
+            rate = (utilization - self.last_sample[1]) / (now - self.last_sample[0])
+            if rate > 0:
+                seconds_to_limit = max(0, 100 - utilization) / rate
+                self.interval = max(CLAUDE_MIN_INTERVAL, min(self.base_interval, seconds_to_limit / 4))
+            elif rate == 0:
+                self.interval = min(CLAUDE_MAX_INTERVAL, self.interval * 1.5)
+            else:
+                self.interval = self.base_interval
+        self.last_sample = (now, utilization)
+
+    def next_delay(self):
+        """Seconds to wait before the next poll"""
+        if self.failures:
+            ceiling = min(CLAUDE_BACKOFF_MAX, self.base_interval * 2 ** (self.failures - 1))
+            return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+        delay = self.interval
+        upcoming = [t - time.time() for t in self.resets.values() if t > time.time()]
+        if upcoming:
+            delay = min(delay, min(upcoming) + CLAUDE_RESET_GRACE)
+        return max(CLAUDE_MIN_INTERVAL / 4, delay)
+
+
+class RollingRegression:
+    """Least-squares line through the samples from the last `window` seconds
 
-        time.sleep(CLAUDE_FETCH_INTERVAL)
+    Keeps running sums, so adding a sample and evicting the expired ones
+    costs O(1) per sample instead of refitting the whole window.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        self.points = deque()
+        self.origin = None  # x values are stored relative to this to keep the sums small
+        self.n = self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def _update(self, x, y, sign):
+        self.n += sign
+        self.sx += sign * x
+        self.sy += sign * y
+        self.sxx += sign * x * x
+        self.sxy += sign * x * y
+
+    def add(self, t, y):
+        if self.origin is None:
+            self.origin = t
+        x = t - self.origin
+        self.points.append((x, y))
+        self._update(x, y, 1)
+        while self.points[0][0] < x - self.window:
+            self._update(*self.points.popleft(), -1)
+
+    def slope(self):
+        """Units per second, or None with fewer than two distinct sample times"""
+        denominator = self.n * self.sxx - self.sx ** 2
+        if self.n < 2 or denominator <= 1e-9:
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+
+class UsageHistory:
+    """Utilization samples for each usage window, in memory and on disk
+
+    The last USAGE_HISTORY_SIZE samples sit in a ring buffer, and every new
+    one is appended to USAGE_LOG_FILE (one JSON object per line), which is
+    replayed on startup. The /usage/history buckets and the rolling
+    regressions behind /usage/forecast are updated as each sample arrives,
+    so `series` and `forecast` are always ready and never rescan the log.
+    """
+
+    WINDOWS = ("five_hour", "seven_day", "seven_day_sonnet")
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.samples = deque(maxlen=USAGE_HISTORY_SIZE)
+        self.buckets = deque(maxlen=USAGE_HISTORY_BUCKETS)
+        self.bucket_start = None
+        self.bucket_sums = {}  # window -> [sum, count] for the newest bucket
+        self.trends = {window: RollingRegression(USAGE_FORECAST_WINDOW) for window in self.WINDOWS}
+        self.latest = {}       # window -> (utilization, resets_at)
+        self.logged = 0
+        self.series = {"bucket_seconds": USAGE_BUCKET_SECONDS, "points": []}
+        self.forecast = {}
+        self._load()
+
+    def _load(self):
+        # Replay only the newest USAGE_HISTORY_SIZE lines, but count them all so
+        # a log that has grown past the limit is compacted on the next write
+        lines = deque(maxlen=USAGE_HISTORY_SIZE)
+        logged = 0
+        try:
+            with open(self.log_file, encoding="utf-8") as f:
+                for line in f:
+                    lines.append(line)
+                    logged += 1
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"  Warning: Could not read usage history: {e}")
+            return
+
+        for line in lines:
+            try:
+                self._add(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue  # Torn or hand-edited line
+        self.logged = logged
+        self._publish()
+
+    def add(self, data, now=None):
+        """Record one poll's usage data (ignored if it has no utilization values)"""
+        sample = {"t": now or time.time()}
+        for window in self.WINDOWS:
+            entry = data.get(window) or {}
+            if isinstance(entry.get("utilization"), (int, float)):
+                sample[window] = entry["utilization"]
+                sample[window + "_resets_at"] = entry.get("resets_at")
+        if len(sample) == 1:
+            return
+
+        self._add(sample)
+        self._log(sample)
+        self._publish()
+
+    def _add(self, sample):
+        t = sample["t"]
+        self.samples.append(sample)
+
+        # Running average per USAGE_BUCKET_SECONDS bucket
+        start = t - t % USAGE_BUCKET_SECONDS
+        if start != self.bucket_start:
+            self.buckets.append(None)
+            self.bucket_start = start
+            self.bucket_sums = {}
+
+        bucket = {"t": datetime.fromtimestamp(start, timezone.utc).isoformat()}
+        for window in self.WINDOWS:
+            if window not in sample:
+                continue
+            utilization = sample[window]
+            sums = self.bucket_sums.setdefault(window, [0.0, 0])
+            sums[0] += utilization
+            sums[1] += 1
+
+            # A drop means the window reset; the old trend no longer applies
+            previous = self.latest.get(window, (None, None))[0]
+            if previous is not None and utilization < previous:
+                self.trends[window].clear()
+            self.trends[window].add(t, utilization)
+            self.latest[window] = (utilization, sample.get(window + "_resets_at"))
+
+        for window, (total, count) in self.bucket_sums.items():
+            bucket[window] = round(total / count, 2)
+        self.buckets[-1] = bucket
+
+    def _log(self, sample):
+        try:
+            if self.logged >= 2 * USAGE_HISTORY_SIZE:
+                # Compact: rewrite the log with just the ring buffer
+                temp_file = self.log_file + ".tmp"
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(s) + "\n" for s in self.samples)
+                os.replace(temp_file, self.log_file)
+                self.logged = len(self.samples)
+            else:
+                with open(self.log_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(sample) + "\n")
+                self.logged += 1
+        except OSError as e:
+            print(f"  Warning: Could not write usage history: {e}")
+
+    def _publish(self):
+        """Rebuild the series and forecast dicts (swapped in whole for readers)"""
+        now = self.samples[-1]["t"] if self.samples else time.time()
+        self.series = {
+            "bucket_seconds": USAGE_BUCKET_SECONDS,
+            "points": list(self.buckets),
+        }
+
+        forecast = {}
+        for window in self.WINDOWS:
+            if window not in self.latest:
+                continue
+            utilization, resets_at = self.latest[window]
+            rate = self.trends[window].slope()
+            entry = {
+                "utilization": utilization,
+                "rate_per_hour": round(rate * 3600, 3) if rate is not None else None,
+                "full_at": None,
+                "hours_to_full": None,
+                "resets_at": resets_at,
+                "resets_first": None,
+            }
+            if rate and rate > 0:
+                seconds = max(0.0, 100 - utilization) / rate
+                entry["full_at"] = datetime.fromtimestamp(now + seconds, timezone.utc).isoformat()
+                entry["hours_to_full"] = round(seconds / 3600, 2)
+                try:
+                    reset = datetime.fromisoformat(resets_at.replace("Z", "+00:00")).timestamp()
+                    entry["resets_first"] = reset < now + seconds
+                except (AttributeError, ValueError):
+                    pass
+            forecast[window] = entry
+
+        self.forecast = {"window_seconds": USAGE_FORECAST_WINDOW, "windows": forecast}
+
+
+claude_poller = UsagePoller(CLAUDE_USAGE_URL, SESSION_KEY, CLAUDE_FETCH_INTERVAL)
+usage_history = UsageHistory(USAGE_LOG_FILE)
+
+
+def fetch_claude_usage():
+    """Poll Claude usage once and add it to the usage history"""
+    claude_data = claude_poller.poll()
+    usage_history.add(claude_data)
+    return FetchResult({
+        "claude": claude_data,
+        "claude_history": usage_history.series,
+        "claude_forecast": usage_history.forecast,
+        "claude_update": datetime.now(),
+        "claude_stale": False,
+    }, "error" not in claude_data)
 
 
 # ============================================================
 #                    PORTFOLIO FUNCTIONS
 # ============================================================
 
-def fetch_portfolio_data():
-    """Fetch current prices and day chart data from Yahoo Finance"""
-    global portfolio_cache
+def run_with_deadline(tasks):
+    """Run {key: callable} tasks on the shared fetch pool, each with its own deadline
 
-    timestamp = time.strftime('%H:%M:%S')
-    print(f"[{timestamp}] Fetching portfolio data...")
+    A task gets FETCH_TIMEOUT seconds from when a worker starts it, so tasks
+    queued behind FETCH_WORKERS busy workers aren't charged for the wait.
+    Tasks that raise or overrun are left out of the results and the refresh
+    stops waiting for them; a request already sent keeps its worker until
+    its own timeout ends it. Whatever is still queued once every wave of
+    FETCH_WORKERS tasks could have used its FETCH_TIMEOUT is dropped too.
+
+    Returns:
+        (results, missed) - {key: return value} and a list of missed keys
+    """
+    started = {}
+
+    def run(key, task):
+        started[key] = time.monotonic()
+        return task()
+
+    futures = {fetch_pool.submit(run, key, task): key for key, task in tasks.items()}
+    cutoff = time.monotonic() + -(-len(futures) // FETCH_WORKERS) * FETCH_TIMEOUT
+    done, pending, overdue = set(), set(futures), set()
+    while pending:
+        now = time.monotonic()
+        deadlines = {future: started[futures[future]] + FETCH_TIMEOUT
+                     for future in pending if futures[future] in started}
+        late = {future for future in pending if now >= min(deadlines.get(future, cutoff), cutoff)}
+        if late:
+            overdue |= late
+            pending -= late
+            continue
+        finished, pending = wait(pending, timeout=min([cutoff, *deadlines.values()]) - now,
+                                 return_when=FIRST_COMPLETED)
+        done |= finished
+
+    results = {}
+    missed = []
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            print(f"  Error fetching {key}: {e}")
+            metrics.inc("upstream_errors_total", upstream="yahoo", status=error_status(e))
+            if is_rate_limited(e):
+                rate_limited.set()
+            missed.append(key)
+
+    for future in overdue:
+        # Running requests can't be interrupted, but queued ones are dropped
+        future.cancel()
+        print(f"  Timed out fetching {futures[future]} after {FETCH_TIMEOUT}s")
+        metrics.inc("upstream_errors_total", upstream="yahoo", status="timeout")
+        missed.append(futures[future])
+
+    return results, missed
+
+
+def _get_quote_json(symbols):
+    """Request one bulk quote payload for a batch of symbols"""
+    params = {"symbols": ",".join(symbols), "formatted": "false"}
+
+    if QUOTE_URL.startswith("https://query1.finance.yahoo.com"):
+        # yfinance's shared session carries the cookie/crumb Yahoo requires
+        return YfData().get_raw_json(QUOTE_URL, params=params, timeout=FETCH_TIMEOUT)
 
-    symbols = list(HOLDINGS.keys())
-    holdings_data = []
-    total_market_value = 0
-    total_cost = 0
-    total_day_gain = 0
+    # Anything else (local stub, proxy) is plain JSON over HTTP
+    url = f"{QUOTE_URL}?{urllib.parse.urlencode(params)}"
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        return json.load(response)
 
-    # Store price data for chart consistency
+
+def fetch_quote(symbol):
+    """Fetch current price and previous close for a single symbol via ticker.info"""
+    ticker = yf.Ticker(symbol)
+    info = ticker.info
+
+    # Use regularMarketPrice (reliable) instead of fast_info.last_price (unreliable)
+    current_price = info.get('regularMarketPrice') or info.get('currentPrice')
+    previous_close = info.get('previousClose') or info.get('regularMarketPreviousClose')
+
+    if current_price is None or previous_close is None:
+        print(f"  Warning: Missing price data for {symbol}, trying fast_info fallback")
+        fast = ticker.fast_info
+        current_price = current_price or fast.last_price
+        previous_close = previous_close or fast.previous_close
+
+    if current_price is None or previous_close is None:
+        raise ValueError(f"No price data for {symbol}")
+
+    return {'current': current_price, 'previous_close': previous_close}
+
+
+def fetch_quotes(symbols):
+    """Fetch current prices for many symbols with bulk quote requests
+
+    Symbols are requested QUOTE_BATCH_SIZE at a time on the fetch pool. Any
+    symbol missing from the bulk responses is fetched individually with
+    fetch_quote(). Symbols that miss the deadline are left out.
+
+    Returns:
+        Dict of {symbol: {'current': price, 'previous_close': price}}
+    """
     price_data = {}
 
-    try:
-        # Fetch current data for all symbols using ticker.info (more reliable than fast_info)
-        for symbol in symbols:
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
+    batches = {}
+    for i in range(0, len(symbols), QUOTE_BATCH_SIZE):
+        batch = symbols[i:i + QUOTE_BATCH_SIZE]
+        batches[f"quotes {batch[0]}..{batch[-1]}"] = batch
 
-                # Use regularMarketPrice (reliable) instead of fast_info.last_price (unreliable)
-                current_price = info.get('regularMarketPrice') or info.get('currentPrice')
-                previous_close = info.get('previousClose') or info.get('regularMarketPreviousClose')
+    payloads, _ = run_with_deadline({key: timed(partial(_get_quote_json, batch), "quote", batch)
+                                     for key, batch in batches.items()})
 
-                if current_price is None or previous_close is None:
-                    print(f"  Warning: Missing price data for {symbol}, trying fast_info fallback")
-                    fast = ticker.fast_info
-                    current_price = current_price or fast.last_price
-                    previous_close = previous_close or fast.previous_close
+    for key, payload in payloads.items():
+        for quote in (payload.get("quoteResponse") or {}).get("result") or []:
+            symbol = quote.get("symbol")
+            current_price = quote.get('regularMarketPrice')
+            previous_close = quote.get('regularMarketPreviousClose') or quote.get('previousClose')
 
-                # Store for chart calculations
+            if symbol in batches[key] and current_price is not None and previous_close is not None:
                 price_data[symbol] = {
                     'current': current_price,
                     'previous_close': previous_close
                 }
 
-                shares = HOLDINGS[symbol]["shares"]
-                cost_per_share = HOLDINGS[symbol]["cost_per_share"]
+    # Per-symbol fallbacks would only add to the load while Yahoo is rate limiting
+    missing = [] if rate_limited.is_set() else [symbol for symbol in symbols if symbol not in price_data]
+    fallback, _ = run_with_deadline({symbol: timed(partial(fetch_quote, symbol), "quote", [symbol])
+                                     for symbol in missing})
+    price_data.update(fallback)
+
+    return price_data
+
+
+class Positions:
+    """One account's holdings as a table (one row per symbol, shares and cost as numpy vectors) plus its cash"""
+
+    def __init__(self, holdings, cash=0.0, money_market=0.0):
+        self.symbols = list(holdings)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.shares = np.array([holdings[symbol]["shares"] for symbol in self.symbols], dtype=float)
+        self.cost = np.array([holdings[symbol]["cost_per_share"] for symbol in self.symbols], dtype=float)
+        self.cash = float(cash)
+        self.money_market = float(money_market)
+
+    def rows(self, symbols):
+        """Row numbers of symbols, for indexing the vectors"""
+        return np.array([self.index[symbol] for symbol in symbols], dtype=np.intp)
+
+    def diff(self, old):
+        """What changed from old to these positions, as "+SYMBOL" (added), "-SYMBOL" (removed),
+        "~SYMBOL" (shares or cost), "cash" and "money market" notes; [] if nothing did"""
+        notes = [f"+{symbol}" for symbol in self.symbols if symbol not in old.index]
+        notes += [f"-{symbol}" for symbol in old.symbols if symbol not in self.index]
+        for symbol in self.symbols:
+            row, old_row = self.index[symbol], old.index.get(symbol)
+            if old_row is not None and (self.shares[row] != old.shares[old_row] or self.cost[row] != old.cost[old_row]):
+                notes.append(f"~{symbol}")
+        if self.cash != old.cash:
+            notes.append("cash")
+        if self.money_market != old.money_market:
+            notes.append("money market")
+        return notes
+
+
+def build_accounts(config=None):
+    """Positions of the default portfolio and of every other account, by name
 
-                market_value = current_price * shares
-                total_cost_basis = cost_per_share * shares
+    Args:
+        config: HOLDINGS_FILE contents, or None for HOLDINGS/CASH/MONEY_MARKET/PORTFOLIOS
+    """
+    if config is None:
+        config = {"holdings": HOLDINGS, "cash": CASH, "money_market": MONEY_MARKET, "portfolios": PORTFOLIOS}
+    accounts = {DEFAULT_PORTFOLIO: Positions(config["holdings"], config.get("cash", 0.0),
+                                             config.get("money_market", 0.0))}
+    for name, account in config.get("portfolios", {}).items():
+        accounts[name] = Positions(account["holdings"], account.get("cash", 0.0), account.get("money_market", 0.0))
+    return accounts
 
-                day_gain_dollars = (current_price - previous_close) * shares
-                day_gain_percent = ((current_price - previous_close) / previous_close) * 100 if previous_close else 0
 
-                total_gain_dollars = market_value - total_cost_basis
-                total_gain_percent = ((market_value - total_cost_basis) / total_cost_basis) * 100 if total_cost_basis else 0
+def read_holdings_file():
+    """Accounts from HOLDINGS_FILE, or None if there is no usable file"""
+    try:
+        with open(HOLDINGS_FILE, encoding="utf-8") as f:
+            return build_accounts(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"  Warning: Ignoring unreadable holdings file: {e}")
+        return None
 
-                holdings_data.append({
-                    "symbol": symbol,
-                    "shares": shares,
-                    "current_price": round(current_price, 2),
-                    "previous_close": round(previous_close, 2),
-                    "cost_per_share": cost_per_share,
-                    "market_value": round(market_value, 2),
-                    "day_gain_dollars": round(day_gain_dollars, 2),
-                    "day_gain_percent": round(day_gain_percent, 2),
-                    "total_gain_dollars": round(total_gain_dollars, 2),
-                    "total_gain_percent": round(total_gain_percent, 2),
-                })
 
-                print(f"  {symbol}: ${current_price:.2f} (prev: ${previous_close:.2f}, day: ${day_gain_dollars:+.2f})")
+def account_symbols():
+    """Every symbol held in any account, each once"""
+    return list(dict.fromkeys(symbol for account in accounts.values() for symbol in account.symbols))
 
-                total_market_value += market_value
-                total_cost += total_cost_basis
-                total_day_gain += day_gain_dollars
 
-            except Exception as e:
-                print(f"  Error fetching {symbol}: {e}")
-
-        # Sort by market value descending
-        holdings_data.sort(key=lambda x: x["market_value"], reverse=True)
-
-        # Add cash and money market
-        total_market_value += CASH + MONEY_MARKET
-
-        # Calculate portfolio day gain percent
-        portfolio_previous = total_market_value - total_day_gain
-        portfolio_day_gain_percent = (total_day_gain / portfolio_previous) * 100 if portfolio_previous > 0 else 0
-
-        # Fetch intraday chart data - pass price_data for consistency
-        chart_data = fetch_intraday_chart(symbols, price_data)
-
-        portfolio_cache["holdings"] = {
-            "positions": holdings_data,
-            "cash": CASH,
-            "money_market": MONEY_MARKET,
-            "total_market_value": round(total_market_value, 2),
-            "total_cost": round(total_cost, 2),
-            "total_day_gain_dollars": round(total_day_gain, 2),
-            "total_day_gain_percent": round(portfolio_day_gain_percent, 2),
-            "last_update": datetime.now().strftime("%H:%M:%S")
-        }
+accounts = read_holdings_file() or build_accounts()
+
+# Valued positions, one array element per priced symbol in market value
+# order. The JSON positions list is only built from these when a response is
+# serialized (holdings_json).
+Holdings = namedtuple("Holdings", [
+    "symbols", "shares", "cost", "current", "previous_close", "stale",
+    "cash", "money_market", "total_market_value", "total_cost", "total_day_gain",
+    "stale_symbols", "last_update",
+])
+
+# A chart series: bar times (epoch seconds), labels and portfolio values, plus
+# an n x m array of per-symbol values (NaN where a symbol has none). info holds
+# the other keys of the chart's JSON form (previous_close, range, stale_symbols).
+Chart = namedtuple("Chart", ["t", "labels", "values", "components", "symbols", "info"])
+
+
+def empty_chart(symbols=(), **info):
+    return Chart(t=np.empty(0, dtype="<i8"), labels=np.empty(0, dtype=str), values=np.empty(0),
+                 components=np.empty((0, len(symbols))), symbols=list(symbols), info=info)
+
+
+def epoch_seconds(index):
+    """Epoch seconds of a DatetimeIndex (naive times are taken as MARKET_TIMEZONE)"""
+    index = index if index.tz is not None else index.tz_localize(MARKET_TIMEZONE)
+    return np.asarray((index - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1), dtype="<i8")
+
+
+class Valuation:
+    """Running portfolio totals and the priced positions sorted by market value
+
+    Keeps each position's latest quote and the totals over every priced
+    position. A quote that changes revalues only its own position: the
+    totals move by the difference and its entry in the sorted index is moved
+    with a bisect, so a single-symbol update costs O(log n) rather than a
+    revaluation of the whole portfolio.
+    """
+
+    def __init__(self, positions):
+        self.positions = positions
+        self.shares = positions.shares.tolist()
+        self.cost_per_share = positions.cost.tolist()
+        self.current = [None] * len(self.shares)
+        self.previous_close = [None] * len(self.shares)
+        self.order = []  # (-market value, row) of every priced position, ascending
+        self.market_value = 0.0
+        self.cost = 0.0
+        self.day_gain = 0.0
+        self.stale_symbols = []
+        self.lock = threading.Lock()
+
+    def _revalue(self, row, current, previous_close):
+        old_current = self.current[row]
+        old_previous = self.previous_close[row]
+        if current == old_current and previous_close == old_previous:
+            return False
+
+        shares = self.shares[row]
+        if old_current is None:
+            self.cost += self.cost_per_share[row] * shares
+        else:
+            old_value = old_current * shares
+            del self.order[bisect.bisect_left(self.order, (-old_value, row))]
+            self.market_value -= old_value
+            self.day_gain -= (old_current - old_previous) * shares
+
+        value = current * shares
+        bisect.insort(self.order, (-value, row))
+        self.market_value += value
+        self.day_gain += (current - previous_close) * shares
+        self.current[row] = current
+        self.previous_close[row] = previous_close
+        return True
+
+    def update(self, symbol, quote):
+        """Apply one symbol's quote; returns True if its position changed"""
+        row = self.positions.index.get(symbol)
+        if row is None:
+            return False
+        with self.lock:
+            return self._revalue(row, float(quote['current']), float(quote['previous_close']))
+
+    def apply(self, price_data, stale_symbols=()):
+        """Apply a fetch cycle's quotes; returns how many positions changed
+
+        Args:
+            price_data: Dict of {symbol: {'current': price, 'previous_close': price}}
+            stale_symbols: Symbols whose quote is last cycle's
+        """
+        changed = 0
+        with self.lock:
+            for symbol, quote in price_data.items():
+                row = self.positions.index.get(symbol)
+                if row is not None and self._revalue(row, float(quote['current']), float(quote['previous_close'])):
+                    changed += 1
+            self.stale_symbols = list(stale_symbols)
+        return changed
+
+    def holdings(self):
+        """Holdings for the current state, positions in market value order"""
+        with self.lock:
+            rows = [row for _, row in self.order]
+            symbols = [self.positions.symbols[row] for row in rows]
+            return Holdings(
+                symbols=symbols,
+                shares=self.positions.shares[rows],
+                cost=self.positions.cost[rows],
+                current=np.array([self.current[row] for row in rows], dtype=float),
+                previous_close=np.array([self.previous_close[row] for row in rows], dtype=float),
+                stale=np.isin(symbols, self.stale_symbols),
+                cash=self.positions.cash,
+                money_market=self.positions.money_market,
+                total_market_value=self.market_value + self.positions.cash + self.positions.money_market,
+                total_cost=self.cost,
+                total_day_gain=self.day_gain,
+                stale_symbols=self.stale_symbols,
+                last_update=datetime.now().strftime("%H:%M:%S"),
+            )
+
+
+valuations = {name: Valuation(account) for name, account in accounts.items()}
 
-        portfolio_cache["chart_data"] = chart_data
-        portfolio_cache["last_update"] = datetime.now()
 
-        print(f"[{timestamp}] Portfolio: ${total_market_value:,.2f} ({total_day_gain:+,.2f} today)")
+def fetch_portfolio_data(reload=None):
+    """Fetch current prices and day chart data from Yahoo Finance
 
+    Quotes and bars are fetched once for the symbols of every account; each
+    account is then valued and charted from them.
+
+    Args:
+        reload: Names of the accounts a HOLDINGS_FILE edit changed. Only these
+            are re-valued and charted, and only symbols with no cached quote
+            or bars yet (newly added holdings) are fetched. Their multi-day
+            charts are left to rebuild_history_charts()
+
+    Returns:
+        FetchResult - ok is False if no fresh quotes came back
+    """
+    with portfolio_lock:
+        return _fetch_portfolio_data(reload)
+
+
+def _fetch_portfolio_data(reload):
+    timestamp = time.strftime('%H:%M:%S')
+    print(f"[{timestamp}] {'Re-valuing' if reload else 'Fetching'} portfolio data...")
+
+    names = [name for name in accounts if reload is None or name in reload]
+    symbols = list(dict.fromkeys(symbol for name in names for symbol in accounts[name].symbols))
+
+    if reload is None:
+        rate_limited.clear()
+
+    # Fetch current prices for all symbols in bulk (falls back per symbol)
+    new_symbols = symbols if reload is None else [symbol for symbol in symbols if symbol not in last_price_data]
+    price_data = fetch_quotes(new_symbols)
+    last_price_data.update(price_data)
+    fetched = bool(price_data) or not new_symbols
+
+    if reload is None:
+        # Symbols that missed their deadline keep last cycle's quote, marked stale
+        stale_symbols = [symbol for symbol in symbols if symbol not in price_data and symbol in last_price_data]
+        for symbol in stale_symbols:
+            price_data[symbol] = last_price_data[symbol]
+        stale_quotes.clear()
+        stale_quotes.update(stale_symbols)
+    else:
+        # Cached quotes stay as fresh (or stale) as the last fetch left them
+        stale_symbols = [symbol for symbol in symbols if symbol in stale_quotes]
+        price_data = {symbol: last_price_data[symbol] for symbol in symbols if symbol in last_price_data}
+
+    holdings = {}
+    for name in names:
+        valuations[name].apply(price_data, [symbol for symbol in stale_symbols if symbol in accounts[name].index])
+        holdings[name] = valuations[name].holdings()
+
+    default = holdings.get(DEFAULT_PORTFOLIO)
+    if default is not None:
+        for symbol, shares, current_price, previous_close in zip(default.symbols, default.shares,
+                                                                 default.current, default.previous_close):
+            print(f"  {symbol}: ${current_price:.2f} (prev: ${previous_close:.2f}, "
+                  f"day: ${(current_price - previous_close) * shares:+.2f})")
+
+    # Fetch intraday chart data - pass price_data for consistency
+    priced = [symbol for symbol in symbols if symbol in price_data]
+    charts = fetch_intraday_charts(priced, price_data, refresh=reload is None and market_phase() != "closed",
+                                   names=names)
+
+    now = datetime.now()
+    changes = {name: {"holdings": holdings[name], "chart": charts[name], "last_update": now, "portfolio_stale": False}
+               for name in names}
+    if reload is None:
+        history_charts = fetch_history_charts(priced, price_data, names=names)
+        for name in names:
+            changes[name]["history"] = history_charts[name]
+    else:
+        # The new totals go out first; the Holdings source's next run rebuilds the multi-day charts
+        history_pending.update(names)
+
+    if default is not None:
+        print(f"[{timestamp}] Portfolio: ${default.total_market_value:,.2f} ({default.total_day_gain:+,.2f} today)")
+    for name, account_holdings in holdings.items():
+        if name != DEFAULT_PORTFOLIO:
+            print(f"  {name}: ${account_holdings.total_market_value:,.2f} "
+                  f"({account_holdings.total_day_gain:+,.2f} today)")
+    return portfolio_result(changes, fetched)
+
+
+def portfolio_result(changes, ok):
+    """FetchResult publishing {account name: Snapshot changes}; accounts left out are left as published"""
+    portfolios = {name: changes.get(name, {}) for name in accounts if name != DEFAULT_PORTFOLIO}
+    return FetchResult(dict(changes.get(DEFAULT_PORTFOLIO, {}), portfolios=portfolios), ok)
+
+
+def reload_holdings():
+    """Switch to the accounts in HOLDINGS_FILE and re-value them
+
+    Accounts whose positions did not change keep their Valuation; the others
+    start a new one. The re-valuation only fetches symbols that were never
+    fetched before and takes everything else from the cached quotes and bars.
+    Without the file, the HOLDINGS/CASH/MONEY_MARKET/PORTFOLIOS settings apply.
+
+    Returns:
+        FetchResult - changes is None if no account changed
+    """
+    global accounts, valuations
+
+    new_accounts = read_holdings_file() if os.path.exists(HOLDINGS_FILE) else build_accounts()
+    if new_accounts is None:
+        return FetchResult(None, True)
+
+    with portfolio_lock:
+        changes = {name: account.diff(accounts[name]) if name in accounts else ["new account"]
+                   for name, account in new_accounts.items()}
+        changes.update({name: ["removed"] for name in accounts if name not in new_accounts})
+        changes = {name: notes for name, notes in changes.items() if notes}
+        if not changes:
+            return FetchResult(None, True)
+
+        print(f"[{time.strftime('%H:%M:%S')}] Holdings changed: "
+              + "; ".join(f"{name} {' '.join(notes)}" for name, notes in changes.items()))
+        valuations = {name: Valuation(account) if name in changes else valuations[name]
+                      for name, account in new_accounts.items()}
+        accounts = new_accounts
+        return fetch_portfolio_data(reload=[name for name in changes if name in accounts])
+
+
+def holdings_file_version():
+    """Modification time and size of HOLDINGS_FILE, or None if it does not exist"""
+    try:
+        stat = os.stat(HOLDINGS_FILE)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+holdings_file_seen = holdings_file_version()
+
+# Accounts re-valued by a reload whose multi-day charts are still the old ones
+history_pending = set()
+
+
+def rebuild_history_charts():
+    """Bring the multi-day charts of reloaded accounts in line with their new holdings"""
+    with portfolio_lock:
+        names = [name for name in accounts if name in history_pending]
+        history_pending.clear()
+        symbols = list(dict.fromkeys(symbol for name in names for symbol in accounts[name].symbols))
+        price_data = {symbol: last_price_data[symbol] for symbol in symbols if symbol in last_price_data}
+        history_charts = fetch_history_charts(list(price_data), price_data, backfill=True, names=names)
+        return portfolio_result({name: {"history": history_charts[name]} for name in names}, True)
+
+
+def check_holdings_file():
+    """Reload HOLDINGS_FILE if it was saved since the last check, else finish a reload's charts"""
+    global holdings_file_seen
+
+    if history_pending:
+        return rebuild_history_charts()
+
+    version = holdings_file_version()
+    if version == holdings_file_seen:
+        return FetchResult(None, True)
+    holdings_file_seen = version
+    return reload_holdings()
+
+
+def download_closes(symbols, **kwargs):
+    """Download Close bars for many symbols in one request
+
+    Returns a time-indexed DataFrame with one column per symbol (NaN where a
+    symbol has no bar). kwargs are passed through to yf.download().
+    """
+    data = yf.download(symbols, group_by="column", auto_adjust=True, progress=False, **kwargs)
+
+    if data is None or data.empty:
+        return pd.DataFrame(columns=symbols, index=pd.DatetimeIndex([]), dtype=float)
+
+    closes = data["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(name=symbols[0])
+
+    return closes.reindex(columns=symbols).sort_index()
+
+
+class IntradayBarStore:
+    """Today's 5-minute closes for every symbol, fetched incrementally
+
+    The first update of a trading day downloads the whole session. After that
+    each batch only asks for bars from its last stored timestamp onward (the
+    newest bar is re-fetched since it may still be forming) and merges them
+    in. A new day in MARKET_TIMEZONE or a newly added symbol triggers a full
+    reload. Symbols whose download fails or misses the deadline keep the bars
+    already stored and are reported as stale.
+    """
+
+    def __init__(self):
+        self.closes = pd.DataFrame(index=pd.DatetimeIndex([]), dtype=float)
+        self.session_date = None
+
+    def _last_bar(self, batch):
+        """Oldest 'newest bar' across a batch, or None if any symbol needs a full load"""
+        last_bars = []
+        for symbol in batch:
+            last = self.closes[symbol].last_valid_index() if symbol in self.closes else None
+            if last is None:
+                return None
+            last_bars.append(last)
+        return min(last_bars)
+
+    def update(self, symbols, refresh=True):
+        """Fetch new bars for symbols and merge them into the store
+
+        With refresh=False (market closed, or a holdings reload) the stored
+        session is returned as is; only symbols with no bars yet are downloaded.
+
+        Returns:
+            (closes, stale_symbols) - closes has one column per symbol
+        """
+        if refresh:
+            load = symbols
+        else:
+            loaded = set(self.closes.columns[self.closes.notna().any().to_numpy()])
+            load = [symbol for symbol in symbols if symbol not in loaded]
+        if not load:
+            return self.closes.reindex(columns=symbols).sort_index(), []
+
+        today = pd.Timestamp.now(tz=MARKET_TIMEZONE).date()
+        if refresh and today != self.session_date or self.session_date is None:
+            # New trading day: drop the previous session and reload in full
+            self.closes = pd.DataFrame(index=pd.DatetimeIndex([]), dtype=float)
+            self.session_date = today
+
+        batches = {}
+        requests = {}
+        for i in range(0, len(load), HISTORY_BATCH_SIZE):
+            batch = load[i:i + HISTORY_BATCH_SIZE]
+            key = f"bars {batch[0]}..{batch[-1]}"
+            since = self._last_bar(batch)
+            window = {"period": "1d"} if since is None else {"start": since}
+            batches[key] = batch
+            requests[key] = timed(partial(download_closes, batch, interval="5m", threads=False,
+                                          timeout=FETCH_TIMEOUT, **window), "intraday", batch)
+
+        frames, missed = run_with_deadline(requests)
+
+        for frame in frames.values():
+            if frame.empty:
+                continue
+            # Fresh bars win over stored ones (the last stored bar may have been partial)
+            self.closes = frame if self.closes.empty else frame.combine_first(self.closes)
+
+        if not self.closes.empty:
+            # Before the open Yahoo serves the previous session; keep only the latest one
+            dates = self.closes.index.date
+            self.closes = self.closes[dates == dates.max()]
+
+        stale_symbols = [symbol for key in missed for symbol in batches[key]]
+        return self.closes.reindex(columns=symbols).sort_index(), stale_symbols
+
+
+bar_store = IntradayBarStore()
+
+
+def fetch_intraday_charts(symbols, price_data=None, refresh=True, names=None):
+    """Fetch today's bars for every account's symbols once and chart each account from them
+
+    Args:
+        symbols: List of stock symbols (every charted account's, each once)
+        price_data: Dict of {symbol: {'current': price, 'previous_close': price}} for consistency
+        refresh: Download new bars (False while the market is closed)
+        names: Accounts to chart (default: all of them)
+
+    Returns:
+        {account name: Chart with info {"previous_close", "stale_symbols"}}
+    """
+    names = list(accounts) if names is None else names
+    try:
+        closes, stale_symbols = bar_store.update(symbols, refresh)
     except Exception as e:
-        print(f"[{timestamp}] Portfolio ERROR: {e}")
+        print(f"  Chart ERROR: {e}")
+        return {name: empty_chart(previous_close=0) for name in names}
+    return {name: intraday_chart(accounts[name], closes, stale_symbols, price_data) for name in names}
 
 
-def fetch_intraday_chart(symbols, price_data=None):
-    """Fetch intraday data and calculate portfolio value over time
+def intraday_chart(account, closes, stale_symbols, price_data=None):
+    """Calculate one account's value over the day from the shared bars
 
     Args:
-        symbols: List of stock symbols
+        account: Positions of the account
+        closes: Bars from IntradayBarStore.update(), one column per symbol
+        stale_symbols: Symbols whose bars could not be refreshed
         price_data: Dict of {symbol: {'current': price, 'previous_close': price}} for consistency
+
+    Returns:
+        Chart with info {"previous_close", "stale_symbols"}
     """
     try:
-        chart_points = {}
+        symbols = [symbol for symbol in account.symbols if symbol in closes.columns]
+        balance = account.cash + account.money_market
+
+        # Each symbol's last close is carried forward over missing bars
+        closes = closes[symbols].dropna(how="all").ffill()
+
+        # Portfolio value = closes . shares for every bar at once
+        shares = account.shares[account.rows(symbols)]
+        close_rows = closes.to_numpy(dtype=float)
+        labels = closes.index.strftime("%H:%M")
+        first = ~labels.duplicated()
+
+        close_rows = close_rows[first]
+        values = np.nan_to_num(close_rows) @ shares + account.cash + account.money_market
+        components = (close_rows * shares).round(2)
+        labels = np.array(labels[first], dtype=str)
+
+        # Calculate previous close value for day gain - use passed price_data for consistency
+        # (fallback: fetch from ticker.info, which is reliable)
+        previous_closes = np.array([price_data[symbol]['previous_close'] if price_data and symbol in price_data
+                                    else fetch_quote(symbol)['previous_close'] for symbol in symbols], dtype=float)
+        previous_close_value = balance + float(previous_closes @ shares)
+
+        # Update the last point with actual current prices to match holdings calculation
+        # This ensures the chart endpoint matches what's shown in the holdings view
+        if price_data and len(values):
+            live = np.array([price_data[symbol]['current'] if symbol in price_data else np.nan
+                             for symbol in symbols], dtype=float) * shares
+            values[-1] = sum(live[~np.isnan(live)].tolist(), balance)
+            components[-1] = live.round(2)
+            labels[-1] = datetime.now().strftime("%H:%M")
+
+        return Chart(t=epoch_seconds(closes.index[first]), labels=labels, values=values,
+                     components=components, symbols=symbols,
+                     info={"previous_close": round(previous_close_value, 2),
+                           "stale_symbols": [symbol for symbol in stale_symbols if symbol in account.index]})
 
-        for symbol in symbols:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period="1d", interval="5m")
+    except Exception as e:
+        print(f"  Chart ERROR: {e}")
+        return empty_chart(previous_close=0)
 
-            if hist.empty:
-                continue
 
-            shares = HOLDINGS[symbol]["shares"]
+# One on-disk price history record
+BAR_DTYPE = np.dtype([("t", "<i8"), ("close", "<f8")])
+
+
+class PriceHistoryStore:
+    """Closed bars per symbol and interval, kept on disk and appended to
+
+    Each (interval, symbol) is a flat file of little-endian (epoch seconds,
+    close) records under HISTORY_DIR, read with NumPy. An update downloads
+    only the bars from the newest one stored on, and only once per bar
+    interval. Bars still forming are skipped, so everything in the files is
+    final (the chart's last point comes from live quotes instead).
+
+    Closes are adjusted for splits and dividends, which rewrites the whole
+    series back from the event. The re-downloaded newest stored bar shows
+    it: when its close no longer matches, the symbol's full range is
+    downloaded again and its file rewritten, so old and new bars stay on
+    the same basis.
+    """
 
-            for timestamp, row in hist.iterrows():
-                ts_str = timestamp.strftime("%H:%M")
-                if ts_str not in chart_points:
-                    chart_points[ts_str] = {
-                        "time": ts_str,
-                        "timestamp": timestamp.isoformat(),
-                        "value": CASH + MONEY_MARKET,
-                        "components": {}
-                    }
-                chart_points[ts_str]["value"] += row["Close"] * shares
-                chart_points[ts_str]["components"][symbol] = round(row["Close"] * shares, 2)
+    def __init__(self, directory):
+        self.directory = directory
+        self.arrays = {}   # (interval, symbol) -> BAR_DTYPE array, loaded on first use
+        self.checked = {}  # interval -> time of the last download
 
-        chart_list = sorted(chart_points.values(), key=lambda x: x["time"])
+    def _path(self, interval, symbol):
+        return os.path.join(self.directory, interval, f"{symbol}.bars")
 
-        # Calculate previous close value - use passed price_data for consistency
-        previous_close_value = CASH + MONEY_MARKET
+    def bars(self, interval, symbol):
+        """Every stored bar for a symbol, oldest first"""
+        key = (interval, symbol)
+        if key not in self.arrays:
+            try:
+                data = np.fromfile(self._path(interval, symbol), dtype=BAR_DTYPE)
+            except (FileNotFoundError, ValueError):
+                data = np.empty(0, dtype=BAR_DTYPE)
+            self.arrays[key] = data
+        return self.arrays[key]
+
+    def _append(self, interval, symbol, new_bars):
+        path = self._path(interval, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(new_bars.tobytes())
+        self.arrays[(interval, symbol)] = np.concatenate([self.bars(interval, symbol), new_bars])
+
+    def _write(self, interval, symbol, bars):
+        path = self._path(interval, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = path + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(bars.tobytes())
+        os.replace(temp_file, path)
+        self.arrays[(interval, symbol)] = bars
+
+    def _download(self, interval, starts):
+        """Download {start epoch: [symbols]} in HISTORY_BATCH_SIZE batches on the fetch pool
+
+        Returns:
+            (frames, missed) - the downloaded frames and the symbols whose
+            download failed or missed the deadline
+        """
+        batches = {}
+        requests = {}
+        for start, group in starts.items():
+            for i in range(0, len(group), HISTORY_BATCH_SIZE):
+                batch = group[i:i + HISTORY_BATCH_SIZE]
+                key = f"{interval} history {batch[0]}..{batch[-1]}"
+                batches[key] = batch
+                requests[key] = timed(partial(download_closes, batch, interval=interval, threads=False,
+                                              timeout=FETCH_TIMEOUT, start=pd.Timestamp(start, unit="s", tz="UTC")),
+                                      "history", batch)
+
+        frames, missed = run_with_deadline(requests)
+        return list(frames.values()), [symbol for key in missed for symbol in batches[key]]
+
+    def update(self, symbols, interval, days, backfill=False):
+        """Download and append the missing tail of each symbol's bars
+
+        Args:
+            symbols: List of stock symbols
+            interval: Yahoo bar interval, a key of INTERVAL_SECONDS
+            days: How far back to start for a symbol with nothing stored
+            backfill: Only download symbols with nothing stored (newly added
+                holdings), whenever the interval was last checked
+
+        Returns:
+            List of symbols whose download failed or missed the deadline
+        """
+        now = time.time()
+        step = INTERVAL_SECONDS[interval]
+        if backfill:
+            symbols = [symbol for symbol in symbols if not len(self.bars(interval, symbol))]
+        elif now - self.checked.get(interval, 0) < step:
+            return []
+
+        # Symbols whose tails start at the same bar share a request. A tail
+        # starts at the newest stored bar, to compare it with Yahoo's close
+        starts = {}
         for symbol in symbols:
-            if price_data and symbol in price_data:
-                # Use the same previous_close as the holdings calculation
-                previous_close_value += price_data[symbol]['previous_close'] * HOLDINGS[symbol]["shares"]
-            else:
-                # Fallback: fetch from ticker.info (reliable)
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                prev_close = info.get('previousClose') or info.get('regularMarketPreviousClose')
-                if prev_close is None:
-                    prev_close = ticker.fast_info.previous_close
-                previous_close_value += prev_close * HOLDINGS[symbol]["shares"]
-
-        # Add/update final point with actual current prices to match holdings calculation
-        # This ensures the chart endpoint matches what's shown in the holdings view
-        if price_data and chart_list:
-            current_value = CASH + MONEY_MARKET
-            components = {}
-            for symbol in symbols:
-                if symbol in price_data:
-                    val = price_data[symbol]['current'] * HOLDINGS[symbol]["shares"]
-                    current_value += val
-                    components[symbol] = round(val, 2)
+            stored = self.bars(interval, symbol)
+            start = int(stored["t"][-1]) if len(stored) else int(now - days * 86400)
+            starts.setdefault(start, []).append(symbol)
+        frames, missed = self._download(interval, starts)
+
+        readjusted = []
+        for frame in frames:
+            times = epoch_seconds(frame.index)
+            for symbol in frame.columns:
+                closes = frame[symbol].to_numpy(dtype=float)
+                stored = self.bars(interval, symbol)
+                last = stored["t"][-1] if len(stored) else -1
+                overlap = np.flatnonzero((times == last) & ~np.isnan(closes))
+                if len(overlap) and not np.isclose(closes[overlap[0]], stored["close"][-1], rtol=1e-6, atol=0):
+                    readjusted.append(symbol)
+                    continue
+                keep = ~np.isnan(closes) & (times > last) & (times + step <= now)
+                if keep.any():
+                    new_bars = np.empty(int(keep.sum()), dtype=BAR_DTYPE)
+                    new_bars["t"] = times[keep]
+                    new_bars["close"] = closes[keep]
+                    self._append(interval, symbol, new_bars)
+
+        if readjusted:
+            frames, readjust_missed = self._download(interval, {int(now - days * 86400): readjusted})
+            for frame in frames:
+                times = epoch_seconds(frame.index)
+                for symbol in frame.columns:
+                    closes = frame[symbol].to_numpy(dtype=float)
+                    keep = ~np.isnan(closes) & (times + step <= now)
+                    if keep.any():
+                        bars = np.empty(int(keep.sum()), dtype=BAR_DTYPE)
+                        bars["t"] = times[keep]
+                        bars["close"] = closes[keep]
+                        self._write(interval, symbol, bars)
+            missed += readjust_missed
+
+        if not missed and not backfill:
+            self.checked[interval] = now
+        return missed
+
+
+price_history = PriceHistoryStore(HISTORY_DIR)
+
+
+def fetch_history_charts(symbols, price_data=None, backfill=False, names=None):
+    """Bring the price history up to date and build every account's CHART_RANGES charts
+
+    The history of each symbol is downloaded once, whichever accounts hold it.
+    With backfill=True only symbols with no history yet are downloaded; names
+    limits the charts to those accounts.
+
+    Returns:
+        {account name: {range: Chart with info {"previous_close", "range", "stale_symbols"}}}
+    """
+    try:
+        stale_symbols = {}
+        for interval in sorted(set(interval for interval, _ in CHART_RANGES.values())):
+            days = max(d for i, d in CHART_RANGES.values() if i == interval)
+            stale_symbols[interval] = price_history.update(symbols, interval, days, backfill)
+    except Exception as e:
+        print(f"  Error fetching price history: {e}")
+        return {name: {} for name in names or accounts}
+
+    priced = set(symbols)
+    return {name: history_charts(accounts[name], [symbol for symbol in accounts[name].symbols if symbol in priced],
+                                 stale_symbols, price_data)
+            for name in names or accounts}
+
+
+def history_charts(account, symbols, stale_symbols, price_data=None):
+    """Build one account's chart for every CHART_RANGES entry from the stored history
+
+    Portfolio value at each bar is the stored closes (each symbol's last close
+    carried forward) times the account's share vector. The last point uses
+    live prices, like the intraday chart.
 
-            # Update the last point with current prices
-            now_time = datetime.now().strftime("%H:%M")
-            chart_list[-1]["value"] = current_value
-            chart_list[-1]["components"] = components
-            chart_list[-1]["time"] = now_time
+    Returns:
+        {range: Chart with info {"previous_close", "range", "stale_symbols"}}
+    """
+    charts = {}
+    try:
+        shares = account.shares[account.rows(symbols)]
+        balance = account.cash + account.money_market
+
+        for name, (interval, days) in CHART_RANGES.items():
+            history = [price_history.bars(interval, symbol) for symbol in symbols]
+            times = np.unique(np.concatenate([bars["t"] for bars in history] + [np.empty(0, dtype="<i8")]))
+            times = times[times >= time.time() - days * 86400]
+
+            closes = np.zeros((len(times), len(symbols)))
+            for j, bars in enumerate(history):
+                last = np.searchsorted(bars["t"], times, side="right") - 1
+                if len(bars):
+                    closes[:, j] = np.where(last >= 0, bars["close"][np.maximum(last, 0)], 0.0)
+
+            components = (closes * shares).round(2)
+            components[components == 0] = np.nan  # No bar yet
+            values = closes @ shares + account.cash + account.money_market
+
+            label_format = "%Y-%m-%d" if interval == "1d" else "%m-%d %H:%M"
+            labels = pd.to_datetime(times, unit="s", utc=True).tz_convert(MARKET_TIMEZONE).strftime(label_format)
+
+            # Finish at the live value so every range ends where the holdings view is
+            if price_data:
+                live = np.array([price_data[symbol]['current'] if symbol in price_data else np.nan
+                                 for symbol in symbols], dtype=float) * shares
+                live = live.round(2)
+                now = pd.Timestamp.now(tz=MARKET_TIMEZONE)
+                times = np.append(times, int(now.timestamp()))
+                labels = labels.append(pd.Index([now.strftime(label_format)]))
+                values = np.append(values, balance + sum(live[~np.isnan(live)].tolist()))
+                components = np.vstack([components, live])
+
+            charts[name] = Chart(
+                t=times, labels=np.array(labels, dtype=str), values=values, components=components,
+                symbols=list(symbols),
+                info={"previous_close": round(float(values[0]), 2) if len(values) else 0, "range": name,
+                      "stale_symbols": [symbol for symbol in stale_symbols[interval] if symbol in account.index]},
+            )
+
+    except Exception as e:
+        print(f"  Error fetching price history: {e}")
+
+    return charts
+
+
+def lttb_indices(values, target):
+    """Pick `target` points that keep a series' shape (Largest-Triangle-Three-Buckets)
+
+    The first and last points are always kept. The points in between are
+    split into target - 2 buckets, and each bucket keeps the point forming
+    the largest triangle with the previous pick and the next bucket's
+    average. Points are treated as evenly spaced, the way the display draws them.
+
+    Returns:
+        numpy array of indices into values, in order
+    """
+    n = len(values)
+    if target >= n or target < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=float)
+    y = np.asarray(values, dtype=float)
+
+    # Bucket i covers [edges[i], edges[i + 1]); every bucket has at least one point
+    edges = np.linspace(1, n - 1, target - 1).astype(int)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+
+    # Third vertex for bucket i: the next bucket's average (the last point for the final bucket)
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    picked = np.empty(target, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(target - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+
+    return picked
+
+
+def downsample_chart(chart, points):
+    """Copy of a Chart reduced to at most `points` points
+
+    Args:
+        chart: Chart as returned by fetch_intraday_chart()
+        points: Target point count
+    """
+    return chart_rows(chart, lttb_indices(chart.values, points))
+
+
+def chart_rows(chart, rows):
+    """Copy of a Chart with only the given points (an index array or a slice)"""
+    return chart._replace(t=chart.t[rows], labels=chart.labels[rows], values=chart.values[rows],
+                          components=chart.components[rows])
+
+
+def columnar_chart(chart, components=True):
+    """Chart data with one array per field instead of one object per point
+
+    Points become "t" (epoch seconds), "time" (labels) and "v" (values),
+    plus "components" ({symbol: values}, null where a symbol has no value)
+    if components is set. The info keys come first, as in chart_json().
+    """
+    columns = dict(chart.info)
+    columns["t"] = chart.t.tolist()
+    columns["time"] = chart.labels.tolist()
+    columns["v"] = chart.values.tolist()
+
+    if components:
+        present = ~np.isnan(chart.components).all(axis=0)
+        if present.any():
+            columns["components"] = {
+                symbol: [v if v == v else None for v in values]
+                for symbol, values in zip(np.array(chart.symbols)[present].tolist(),
+                                          chart.components[:, present].T.tolist())
+            }
+    return columns
+
+
+def binary_chart(chart, components=True):
+    """Chart data packed for typed-array views on the display
+
+    Little-endian layout, every section 4-byte aligned:
+        Int32 n, Int32 m, Float32 previous_close, 4 bytes padding
+        Int32[n]      t (epoch seconds)
+        Float32[n]    v
+        Float32[m*n]  one row of values per component symbol (NaN where missing)
+        UTF-8         the m symbol names, comma-separated
+    """
+    present = ~np.isnan(chart.components).all(axis=0) if components else np.zeros(len(chart.symbols), dtype=bool)
+    symbols = np.array(chart.symbols, dtype=str)[present].tolist()
+
+    header = struct.pack("<iif4x", len(chart.t), len(symbols), chart.info.get("previous_close", 0))
+    return b"".join([
+        header,
+        chart.t.astype("<i4").tobytes(),
+        chart.values.astype("<f4").tobytes(),
+        np.ascontiguousarray(chart.components[:, present].T, dtype="<f4").tobytes(),
+        ",".join(symbols).encode(),
+    ])
+
+
+def market_phase(now=None):
+    """Exchange session phase at `now`: pre_market, regular, after_hours or closed"""
+    now = now or pd.Timestamp.now(tz=MARKET_TIMEZONE)
+    if now.weekday() >= 5 or now.strftime("%Y-%m-%d") in MARKET_HOLIDAYS:
+        return "closed"
+
+    clock = now.strftime("%H:%M")
+    for phase, (start, end) in MARKET_SESSIONS.items():
+        if start <= clock < end:
+            return phase
+    return "closed"
+
+
+def next_phase_change(now):
+    """First session boundary (see MARKET_SESSIONS) after `now`"""
+    day = now.normalize()
+    for offset in range(2):
+        for boundary in sorted({t for session in MARKET_SESSIONS.values() for t in session}):
+            hours, minutes = map(int, boundary.split(":"))
+            change = (day + pd.Timedelta(days=offset)).replace(hour=hours, minute=minutes)
+            if change > now:
+                return change
+    return now + pd.Timedelta(days=1)
+
+
+def is_rate_limited(error):
+    """True if an exception is Yahoo answering HTTP 429 Too Many Requests"""
+    return (getattr(error, "code", None) == 429
+            or type(error).__name__ == "YFRateLimitError"
+            or "Too Many Requests" in str(error))
+
+
+class RefreshScheduler:
+    """Plans the next fetch from the market phase and recent failures
+
+    A successful fetch waits REFRESH_INTERVALS[phase], but never past the
+    next session boundary, so the fast session cadence starts on time.
+    Each failure in a row doubles the wait, up to BACKOFF_MAX; when Yahoo
+    is rate limiting (HTTP 429) the doubling starts from RATE_LIMIT_BACKOFF.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.last_fetch = None
+        self.last_ok = None
+        self.next_fetch = None
+        self.phase = market_phase()
+
+    def _interval(self, now):
+        phase = market_phase(now)
+        return phase, min(REFRESH_INTERVALS[phase], (next_phase_change(now) - now).total_seconds())
+
+    def plan(self, ok, rate_limited=False):
+        """Record a fetch result and return seconds to wait before the next one"""
+        now = pd.Timestamp.now(tz=MARKET_TIMEZONE)
+        self.phase, delay = self._interval(now)
+        self.failures = 0 if ok and not rate_limited else self.failures + 1
+
+        if self.failures:
+            base = max(REFRESH_INTERVALS[self.phase], RATE_LIMIT_BACKOFF) if rate_limited else REFRESH_INTERVALS[self.phase]
+            delay = min(BACKOFF_MAX, base * 2 ** (self.failures - 1))
+            print(f"  Portfolio fetch {'rate limited' if rate_limited else 'failed'} ({self.failures} in a row), "
+                  f"retrying in {delay:.0f}s")
+
+        self.last_fetch = now
+        self.last_ok = ok and not rate_limited
+        self.next_fetch = now + pd.Timedelta(seconds=delay)
+        return delay
+
+    def status(self, count=5):
+        """Current phase, backoff state and the next `count` planned fetch times"""
+        planned = []
+        when = self.next_fetch
+        while when is not None and len(planned) < count:
+            planned.append({"time": when.isoformat(), "phase": market_phase(when)})
+            when = when + pd.Timedelta(seconds=max(1, self._interval(when)[1]))
 
         return {
-            "points": chart_list,
-            "previous_close": round(previous_close_value, 2)
+            "phase": self.phase,
+            "last_fetch": self.last_fetch.isoformat() if self.last_fetch else None,
+            "last_ok": self.last_ok,
+            "failures": self.failures,
+            "next_fetch": planned[0]["time"] if planned else None,
+            "planned": planned,
+            "intervals": REFRESH_INTERVALS,
         }
 
-    except Exception as e:
-        print(f"  Chart ERROR: {e}")
-        return {"points": [], "previous_close": 0}
 
+portfolio_schedule = RefreshScheduler()
 
-def fetch_portfolio_loop():
-    """Background thread to update portfolio data"""
-    while True:
-        fetch_portfolio_data()
-        time.sleep(PORTFOLIO_FETCH_INTERVAL)
+
+# ============================================================
+#                    SOURCE ENGINE
+# ============================================================
+
+class RefreshTooSoon(Exception):
+    """An on-demand refresh was asked for within the source's refresh spacing"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Refreshed recently, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# What a source's fetch returns: Snapshot changes to publish (or None) and
+# whether the fetch succeeded, which its schedule uses to pick the next wait
+FetchResult = namedtuple("FetchResult", ["changes", "ok"])
+
+
+class Source:
+    """A data source run by SourceEngine
+
+    Args:
+        name: Label for log messages
+        fetch: Coroutine function, or blocking function (run on the engine's
+            worker threads), returning a FetchResult
+        schedule: Function(ok) -> seconds until the next fetch
+        slots: Snapshot fields this source publishes
+        timeout: Seconds before a fetch counts as failed
+        retries: Quick retries after an exception or timeout
+        refresh_spacing: Seconds after a fetch starts before refresh() may start another
+        quiet: Only record refresh metrics for fetches that publish something
+            (for frequent local checks that usually find nothing new)
+    """
+
+    def __init__(self, name, fetch, schedule, slots, timeout, retries=1, refresh_spacing=0, quiet=False):
+        self.name = name
+        self.fetch = fetch
+        self.schedule = schedule
+        self.slots = set(slots)
+        self.timeout = timeout
+        self.retries = retries
+        self.refresh_spacing = refresh_spacing
+        self.quiet = quiet
+        self.pending = None  # A blocking fetch still running after its timeout
+        self.current = None  # The fetch in progress, shared by everyone waiting on it
+        self.last_start = None
+
+
+class SourceEngine:
+    """Runs every registered Source on one asyncio event loop
+
+    Each source is a task that sleeps until its next scheduled fetch, so a
+    new source is one add() call rather than another thread with its own
+    loop. Concurrency limits, timeouts, retries and publication to the
+    snapshot are handled here for all of them.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.workers = ThreadPoolExecutor(max_workers=SOURCE_WORKERS, thread_name_prefix="source")
+        self.loop = None
+        self.started = threading.Event()  # Set once the loop is running and refresh() may schedule on it
+
+    def add(self, source):
+        self.sources.append(source)
+
+    def start(self):
+        """Run the event loop on a daemon thread"""
+        threading.Thread(target=asyncio.run, args=(self._run(),), name="sources", daemon=True).start()
+
+    async def _run(self):
+        self.loop = asyncio.get_running_loop()
+        self.limit = asyncio.Semaphore(SOURCE_CONCURRENCY)
+        self.started.set()
+        await asyncio.gather(*(self._source_loop(source) for source in self.sources))
+
+    def refresh(self, name):
+        """Fetch a source now, callable from any thread
+
+        Joins the source's fetch if one is already in progress, so
+        concurrent callers share one upstream request. Returns a
+        concurrent.futures.Future of (ok, snapshot after the fetch), which
+        raises RefreshTooSoon within refresh_spacing of the last fetch start.
+        Raises FutureTimeout if the loop is not running within REFRESH_WAIT.
+        """
+        source = next(source for source in self.sources if source.name == name)
+        if not self.started.wait(REFRESH_WAIT):
+            raise FutureTimeout("Source engine is not running")
+        return asyncio.run_coroutine_threadsafe(self._refresh(source), self.loop)
+
+    async def _refresh(self, source):
+        if source.current is None or source.current.done():
+            wait = source.last_start + source.refresh_spacing - time.monotonic() if source.last_start else 0
+            if wait > 0:
+                raise RefreshTooSoon(wait)
+        return await self._run_once(source)
+
+    async def _source_loop(self, source):
+        while True:
+            # An error here (publishing, scheduling) must not end this loop, or the
+            # gather() in _run and with it every other source
+            try:
+                ok, _ = await self._run_once(source)
+                delay = source.schedule(ok)
+            except Exception as e:
+                print(f"[{time.strftime('%H:%M:%S')}] {source.name} ERROR: {e}")
+                delay = SOURCE_RETRY_DELAY
+            await asyncio.sleep(delay)
+
+    def _run_once(self, source):
+        """Start a fetch unless one is in progress; resolves to (ok, snapshot)"""
+        if source.current is None or source.current.done():
+            source.last_start = time.monotonic()
+            source.current = asyncio.ensure_future(self._fetch_and_snapshot(source))
+        # A caller cancelled mid-wait must not cancel the fetch for the others
+        return asyncio.shield(source.current)
+
+    async def _fetch_and_snapshot(self, source):
+        start = time.perf_counter()
+        ok, published = await self._fetch(source)
+        if published or not source.quiet:
+            metrics.observe("refresh_duration_seconds", time.perf_counter() - start, source=source.name.lower())
+            if ok:
+                metrics.set("refresh_last_success_timestamp_seconds", time.time(), source=source.name.lower())
+        return ok, snapshot
+
+    async def _fetch(self, source):
+        """Fetch with retries and publish the result; returns (succeeded, published anything)"""
+        for attempt in range(source.retries + 1):
+            if attempt:
+                await asyncio.sleep(SOURCE_RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            timestamp = time.strftime('%H:%M:%S')
+            try:
+                async with self.limit:
+                    result = await asyncio.wait_for(self._call(source), source.timeout)
+            except asyncio.TimeoutError:
+                print(f"[{timestamp}] {source.name} ERROR: timed out after {source.timeout}s")
+                continue
+            except Exception as e:
+                print(f"[{timestamp}] {source.name} ERROR: {e}")
+                continue
+
+            if result.changes:
+                unknown = set(result.changes) - source.slots
+                if unknown:
+                    print(f"  {source.name}: ignoring fields outside its slots: {', '.join(sorted(unknown))}")
+                # Serializing, compressing and saving the snapshot happens off the loop,
+                # so the other sources keep running meanwhile (publish_lock orders publishers)
+                changes = {key: value for key, value in result.changes.items() if key in source.slots}
+                await self.loop.run_in_executor(None, partial(publish_snapshot, **changes))
+            return result.ok, bool(result.changes)
+
+        return False, False
+
+    async def _call(self, source):
+        if asyncio.iscoroutinefunction(source.fetch):
+            return await source.fetch()
+
+        # A blocking call can't be interrupted at the timeout; don't stack another behind it
+        if source.pending is not None and not source.pending.done():
+            await source.pending
+        source.pending = self.loop.run_in_executor(self.workers, source.fetch)
+        return await asyncio.shield(source.pending)
+
+
+engine = SourceEngine()
+engine.add(Source(
+    "Claude", fetch_claude_usage,
+    schedule=lambda ok: claude_poller.next_delay(),
+    slots=["claude", "claude_history", "claude_forecast", "claude_update", "claude_stale"],
+    timeout=CLAUDE_TIMEOUT * 2,
+    refresh_spacing=CLAUDE_MIN_INTERVAL,
+))
+engine.add(Source(
+    "Portfolio", fetch_portfolio_data,
+    schedule=lambda ok: portfolio_schedule.plan(ok, rate_limited.is_set()),
+    slots=["holdings", "chart", "history", "last_update", "portfolio_stale", "portfolios"],
+    timeout=PORTFOLIO_TIMEOUT,
+    refresh_spacing=REFRESH_MIN_SPACING,
+))
+engine.add(Source(
+    "Holdings", check_holdings_file,
+    schedule=lambda ok: 0 if history_pending else HOLDINGS_CHECK_INTERVAL,
+    slots=["holdings", "chart", "history", "last_update", "portfolio_stale", "portfolios"],
+    timeout=PORTFOLIO_TIMEOUT,
+    retries=0,
+    quiet=True,
+))
 
 
 # ============================================================
 #                    API ENDPOINTS
 # ============================================================
 
+class EventBroker:
+    """Fans published data out to every connected /stream client
+
+    Keeps the last STREAM_HISTORY events so a client reconnecting with
+    Last-Event-ID only gets what it missed. Clients with no (or a too old)
+    Last-Event-ID get the latest event of each kind instead. Event ids are
+    "epoch:counter" with an epoch per process, since the counter starts
+    over on a restart; an id from another process counts as none.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=STREAM_HISTORY)
+        self.latest = {}
+        self.last_id = 0
+        self.epoch = os.urandom(4).hex()
+
+    def event_id(self, counter):
+        """The SSE id for an event counter"""
+        return f"{self.epoch}:{counter}"
+
+    def cursor(self, last_event_id):
+        """The counter in a Last-Event-ID sent by this process, or None"""
+        epoch, _, counter = (last_event_id or "").rpartition(":")
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(counter)
+        except ValueError:
+            return None
+
+    def publish(self, event, data):
+        """Push one event (pre-serialized JSON bytes) to all clients"""
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, event, data))
+            self.latest[event] = (self.last_id, event, data)
+            self.condition.notify_all()
+
+    def since(self, last_id, timeout=None):
+        """Events newer than last_id, waiting up to timeout for one to arrive
+
+        Returns:
+            (events, cursor) - list of (id, event, data) and the id to resume from
+        """
+        with self.condition:
+            if timeout:
+                self.condition.wait_for(lambda: self.last_id > last_id, timeout)
+
+            if last_id is not None and self.events and self.events[0][0] - 1 <= last_id <= self.last_id:
+                events = [e for e in self.events if e[0] > last_id]
+            else:
+                events = sorted(self.latest.values())
+            return events, self.last_id
+
+
+broker = EventBroker()
+
+
+def stream_events(last_event_id):
+    """Generate Server-Sent Events chunks for one client, forever
+
+    Sends a comment line as a heartbeat whenever STREAM_HEARTBEAT seconds
+    pass without new data, so dead connections are noticed.
+    """
+    yield f"retry: {STREAM_RETRY_MS}\n\n".encode()
+
+    events, cursor = broker.since(broker.cursor(last_event_id))
+    while True:
+        for counter, event, data in events:
+            yield f"id: {broker.event_id(counter)}\nevent: {event}\ndata: ".encode() + data + b"\n\n"
+        if not events:
+            yield b": heartbeat\n\n"
+        events, cursor = broker.since(cursor, timeout=STREAM_HEARTBEAT)
+
+
+def build_payload(data, version, last_update):
+    """Serialize data once into plain and gzip-compressed JSON bodies
+
+    Each body gets a strong ETag derived from the data version (the gzip
+    body has its own, since it is a different representation) and a
+    Last-Modified date from the time the data was fetched. Data that is
+    already bytes is sent as-is with a binary content type.
+    """
+    if isinstance(data, bytes):
+        body, content_type = data, "application/octet-stream"
+    else:
+        body, content_type = json.dumps(data).encode(), "application/json"
+    return {
+        "body": body,
+        "content_type": content_type,
+        "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL),
+        "etag": f'"{version}"',
+        "gzip_etag": f'"{version}-gzip"',
+        "last_modified": format_datetime(last_update.astimezone(timezone.utc), usegmt=True) if last_update else None,
+    }
+
+
+def not_modified(headers, etag, last_modified):
+    """True if a request's If-None-Match / If-Modified-Since match the payload"""
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+    if_modified_since = headers.get("If-Modified-Since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def _number(value):
+    """A float from an array as JSON would have shown the original (3, not 3.0)"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def holdings_json(holdings, stale=False):
+    """The JSON form of Holdings: positions (already in market value order), then totals"""
+    market_value = holdings.current * holdings.shares
+    cost_basis = holdings.cost * holdings.shares
+    day_gain = (holdings.current - holdings.previous_close) * holdings.shares
+    with np.errstate(divide="ignore", invalid="ignore"):
+        day_percent = np.where(holdings.previous_close != 0,
+                               (holdings.current - holdings.previous_close) / holdings.previous_close * 100, 0)
+        total_percent = np.where(cost_basis != 0, (market_value - cost_basis) / cost_basis * 100, 0)
+
+    columns = zip(holdings.shares.tolist(), holdings.current.tolist(), holdings.previous_close.tolist(),
+                  holdings.cost.tolist(), market_value.tolist(), day_gain.tolist(), day_percent.tolist(),
+                  (market_value - cost_basis).tolist(), total_percent.tolist(), holdings.stale.tolist())
+    positions_data = []
+    for symbol, (shares, current, previous, cost, value, gain, gain_pct, total_gain, total_pct,
+                 stale_row) in zip(holdings.symbols, columns):
+        positions_data.append({
+            "symbol": symbol,
+            "shares": _number(shares),
+            "current_price": round(current, 2),
+            "previous_close": round(previous, 2),
+            "cost_per_share": _number(cost),
+            "market_value": round(value, 2),
+            "day_gain_dollars": round(gain, 2),
+            "day_gain_percent": round(gain_pct, 2),
+            "total_gain_dollars": round(total_gain, 2),
+            "total_gain_percent": round(total_pct, 2),
+            "stale": stale_row,
+        })
+
+    portfolio_previous = holdings.total_market_value - holdings.total_day_gain
+    data = {
+        "positions": positions_data,
+        "cash": holdings.cash,
+        "money_market": holdings.money_market,
+        "total_market_value": round(holdings.total_market_value, 2),
+        "total_cost": round(holdings.total_cost, 2),
+        "total_day_gain_dollars": round(holdings.total_day_gain, 2),
+        "total_day_gain_percent": round(holdings.total_day_gain / portfolio_previous * 100, 2)
+        if portfolio_previous > 0 else 0,
+        "stale_symbols": holdings.stale_symbols,
+        "last_update": holdings.last_update,
+    }
+    if stale:
+        data["stale"] = True
+    return data
+
+
+def chart_timestamps(chart):
+    """ISO 8601 times (in MARKET_TIMEZONE) of a Chart's points"""
+    stamps = pd.to_datetime(chart.t, unit="s", utc=True).tz_convert(MARKET_TIMEZONE)
+    return [stamp.isoformat() for stamp in stamps]
+
+
+def chart_json(chart, components=True):
+    """The JSON form of a Chart: a list of point objects, then its info keys"""
+    point_rows = zip(chart.labels.tolist(), chart_timestamps(chart), chart.values.tolist())
+    if not components:
+        points = [{"time": label, "timestamp": stamp, "value": value} for label, stamp, value in point_rows]
+    else:
+        points = [
+            {"time": label, "timestamp": stamp, "value": value,
+             "components": {symbol: v for symbol, v in zip(chart.symbols, row) if v == v}}
+            for (label, stamp, value), row in zip(point_rows, chart.components.tolist())
+        ]
+    return {"points": points, **chart.info}
+
+
+def build_responses(snap):
+    """Pre-serialize every endpoint's response for a snapshot"""
+    claude_version = f"c{snap.claude_version}"
+    portfolio_version = f"p{snap.portfolio_version}"
+    latest_update = max([t for t in (snap.claude_update, snap.last_update) if t], default=None)
+
+    status = {
+        "claude_data": "five_hour" in snap.claude,
+        "portfolio_data": snap.holdings is not None,
+        "stale": snap.claude_stale or snap.portfolio_stale
+    }
+
+    # Data restored from disk is served as-is but flagged until the first refresh
+    claude = dict(snap.claude, stale=True) if snap.claude_stale else snap.claude
+
+    return {
+        "index": build_payload({
+            "status": "ok",
+            "server": "Car Thing Dashboard Server",
+            "endpoints": ["/claude", "/usage/history", "/usage/forecast", "/portfolio", "/chart", "/portfolio/<name>",
+                          "/chart/<name>", "/all/<name>", "/stream", "/schedule", "/metrics", "POST /refresh",
+                          "POST /claude/refresh"],
+            **status
+        }, f"{claude_version}.{portfolio_version}", latest_update),
+        "claude": build_payload(claude, claude_version, snap.claude_update),
+        "usage_history": build_payload(snap.claude_history, claude_version, snap.claude_update),
+        "usage_forecast": build_payload(snap.claude_forecast, claude_version, snap.claude_update),
+        **portfolio_responses(snap),
+        "health": build_payload({"status": "ok", **status},
+                                f"{claude_version}.{portfolio_version}", latest_update),
+        "unknown_portfolio": build_payload({"error": "Unknown portfolio", "portfolios": list(accounts)},
+                                           portfolio_version, None),
+    }
+
+
+def portfolio_responses(snap):
+    """Pre-serialize the /portfolio, /chart and /all responses of a snapshot (or an account's)"""
+    portfolio_version = f"p{snap.portfolio_version}"
+    holdings = holdings_json(snap.holdings, snap.portfolio_stale) if snap.holdings is not None else None
+    chart = chart_json(snap.chart) if snap.chart is not None else None
+
+    return {
+        "portfolio": build_payload(dict(holdings, version=snap.portfolio_version) if holdings
+                                   else {"error": "Data not loaded yet"}, portfolio_version, snap.last_update),
+        "chart": build_payload(dict(chart, version=snap.portfolio_version) if chart
+                               else {"error": "Data not loaded yet"}, portfolio_version, snap.last_update),
+        "all": build_payload({
+            "holdings": holdings,
+            "chart": chart,
+            "last_update": snap.last_update.isoformat() if snap.last_update else None,
+            "stale": snap.portfolio_stale,
+            "version": snap.portfolio_version
+        }, portfolio_version, snap.last_update),
+    }
+
+
+def chart_payload(snap, points=None, components=True, chart_range="1D", chart_format="points"):
+    """Payload for /chart: today's chart or a CHART_RANGES chart, downsampled to `points` points if given
+
+    chart_format is "points" (a list of point objects), "columns"
+    (columnar_chart) or "binary" (binary_chart). Payloads other than the
+    plain 1D chart are built on first request and cached on the snapshot,
+    so each variant is computed at most once per data version.
+    """
+    if chart_range == "1D" and chart_format == "points" and (snap.chart is None or (points is None and components)):
+        return snap.responses["chart"]
+
+    key = (chart_range, points, components, chart_format)
+    payload = snap.chart_sizes.get(key)
+    if payload is None:
+        chart = snap.chart if chart_range == "1D" else snap.history.get(chart_range)
+        if chart is None:
+            chart = {"error": "Data not loaded yet"}
+        else:
+            if points is not None:
+                chart = downsample_chart(chart, points)
+            if chart_format == "columns":
+                chart = columnar_chart(chart, components)
+            elif chart_format == "binary":
+                chart = binary_chart(chart, components)
+            else:
+                chart = chart_json(chart, components)
+            if chart_format != "binary":
+                chart["version"] = snap.portfolio_version
+        etag = f"p{snap.portfolio_version}-{chart_range}-{points or 'all'}{'c' if components else ''}-{chart_format}"
+        payload = build_payload(chart, etag, snap.last_update)
+        snap.chart_sizes[key] = payload
+    return payload
+
+
+def all_payload(snap, chart_format="points"):
+    """Payload for /all, with the chart in columnar form if chart_format is "columns" or "binary"
+
+    /all is JSON, so "binary" falls back to "columns" here.
+    """
+    if chart_format == "points" or snap.chart is None:
+        return snap.responses["all"]
+
+    key = ("all", "columns")
+    payload = snap.chart_sizes.get(key)
+    if payload is None:
+        payload = build_payload({
+            "holdings": holdings_json(snap.holdings, snap.portfolio_stale) if snap.holdings is not None else None,
+            "chart": columnar_chart(snap.chart),
+            "last_update": snap.last_update.isoformat() if snap.last_update else None,
+            "stale": snap.portfolio_stale,
+            "version": snap.portfolio_version
+        }, f"p{snap.portfolio_version}-columns", snap.last_update)
+        snap.chart_sizes[key] = payload
+    return payload
+
+
+def snapshot_base(snap):
+    """What later snapshots need to build a ?since= delta against this one
+
+    Holdings are immutable and small, so they are kept whole; of the chart
+    only the times of its first and last points are needed.
+    """
+    chart = snap.chart
+    span = (int(chart.t[0]), int(chart.t[-1])) if chart is not None and len(chart.t) else None
+    return snap.holdings, span
+
+
+def holdings_delta(old, new, stale=False):
+    """The JSON form of new's changes from old: changed positions, totals, and removed symbols
+
+    A position is changed if it is new or any of its numbers (or its stale
+    flag) differ. The changed positions keep holdings_json()'s market value
+    order, so clients merging them into what they have re-sort by
+    market_value.
+    """
+    old_rows = {symbol: i for i, symbol in enumerate(old.symbols)}
+    rows = np.array([old_rows.get(symbol, -1) for symbol in new.symbols], dtype=np.intp)
+    changed = rows < 0
+    if len(old.symbols):
+        for field in ("shares", "cost", "current", "previous_close", "stale"):
+            changed |= getattr(old, field)[rows] != getattr(new, field)
+
+    keep = np.flatnonzero(changed)
+    data = holdings_json(new._replace(symbols=[new.symbols[i] for i in keep], shares=new.shares[keep],
+                                      cost=new.cost[keep], current=new.current[keep],
+                                      previous_close=new.previous_close[keep], stale=new.stale[keep]), stale)
+    symbols = set(new.symbols)
+    data["removed"] = [symbol for symbol in old.symbols if symbol not in symbols]
+    return data
+
+
+def chart_delta(span, chart, points=None, components=True, chart_format="points"):
+    """The points of chart from the last one a client with `span` has, or None if it needs the whole chart
+
+    The client's last point is sent again, since the live last point is
+    rewritten every cycle: clients drop their points from the first time in
+    the delta on and append the delta's. A chart that started over (a new
+    day), that the client has downsampled (more than `points` points) or in
+    binary form can't be patched.
+    """
+    if span is None or chart is None or not len(chart.t) or chart_format == "binary":
+        return None
+    if (points is not None and len(chart.t) > points) or chart.t[0] != span[0]:
+        return None
+
+    start = int(np.searchsorted(chart.t, span[1]))
+    if start == len(chart.t) or chart.t[start] != span[1]:
+        return None
+    tail = chart_rows(chart, slice(start, None))
+    return columnar_chart(tail, components) if chart_format == "columns" else chart_json(tail, components)
+
+
+def delta_payload(snap, kind, since, points=None, components=True, chart_range="1D", chart_format="points"):
+    """Payload for a ?since=<version> request: only what changed after that version
+
+    kind is "portfolio", "chart" or "all". The data has "delta": true,
+    "version" and "since"; its holdings are holdings_delta() and its chart
+    chart_delta(). Returns None (so the full payload is sent instead) when
+    since is None, older than DELTA_HISTORY versions, from another run, or
+    the chart can't be patched. Deltas are cached on the snapshot like the
+    chart variants.
+    """
+    if since is None or snap.holdings is None or chart_range != "1D":
+        return None
+    base = snapshot_base(snap) if since == snap.portfolio_version else snap.portfolio_bases.get(since)
+    if base is None:
+        return None
+    if kind == "all":
+        components, chart_format = True, "points" if chart_format == "points" else "columns"
+
+    key = ("since", kind, since, points, components, chart_format)
+    payload = snap.chart_sizes.get(key)
+    if payload is None:
+        holdings, span = base
+        data = {"delta": True, "version": snap.portfolio_version, "since": since}
+        if kind == "portfolio":
+            data.update(holdings_delta(holdings, snap.holdings, snap.portfolio_stale))
+        else:
+            chart = chart_delta(span, snap.chart, points, components, chart_format)
+            if chart is None:
+                return None
+            if kind == "chart":
+                data.update(chart)
+            else:
+                data.update(holdings=holdings_delta(holdings, snap.holdings, snap.portfolio_stale), chart=chart,
+                            last_update=snap.last_update.isoformat() if snap.last_update else None,
+                            stale=snap.portfolio_stale)
+        etag = f"p{snap.portfolio_version}-since{since}-{kind}-{points or 'all'}{'c' if components else ''}-{chart_format}"
+        payload = build_payload(data, etag, snap.last_update)
+        snap.chart_sizes[key] = payload
+    return payload
+
+
+def schedule_payload():
+    """Payload for /schedule, built per request from the portfolio scheduler's state"""
+    status = portfolio_schedule.status()
+    return build_payload(status, f"schedule-{status['next_fetch']}", portfolio_schedule.last_fetch)
+
+
+def chart_options(query):
+    """Parse /chart query parameters into chart_payload() arguments
+
+    range picks 1D (default) or a CHART_RANGES chart; points (or width, one
+    point per pixel) sets the target point count; format picks points
+    (default), columns or binary; components=1 keeps per-symbol components,
+    which are otherwise dropped whenever any option is given. Returns
+    (None, True, "1D", "points") for a plain /chart.
+    """
+    params = urllib.parse.parse_qs(query)
+    size = (params.get("points") or params.get("width") or [None])[0]
+    components = (params.get("components") or [None])[0]
+    chart_range = (params.get("range") or ["1D"])[0].upper()
+    chart_format = chart_format_option(query)
+
+    try:
+        points = max(3, min(MAX_CHART_POINTS, int(size))) if size else None
+    except ValueError:
+        points = None
+    if chart_range not in CHART_RANGES:
+        chart_range = "1D"
+
+    if points is None and components is None and chart_range == "1D" and chart_format == "points":
+        return None, True, "1D", "points"
+    return points, components in ("1", "true"), chart_range, chart_format
+
+
+def chart_format_option(query):
+    """The ?format= option of /chart and /all: points (default), columns or binary"""
+    chart_format = (urllib.parse.parse_qs(query).get("format") or ["points"])[0].lower()
+    return chart_format if chart_format in ("columns", "binary") else "points"
+
+
+def since_option(query):
+    """The ?since=<version> option of /portfolio, /chart and /all, or None"""
+    since = (urllib.parse.parse_qs(query).get("since") or [None])[0]
+    try:
+        return int(since) if since is not None else None
+    except ValueError:
+        return None
+
+
+def next_portfolio_version(snap, changes):
+    """Add the next portfolio_version of snap, and the ?since= bases that go with it, to changes"""
+    changes.setdefault("portfolio_version", snap.portfolio_version + 1)
+    bases = dict(snap.portfolio_bases)
+    if snap.holdings is not None:
+        bases[snap.portfolio_version] = snapshot_base(snap)
+    changes["portfolio_bases"] = dict(sorted(bases.items())[-DELTA_HISTORY:])
+    return changes
+
+
+def publish_snapshot(**changes):
+    """Build the next Snapshot with changes applied and swap it in
+
+    Called by both fetcher threads (claude=... or holdings=/chart=...) and
+    once at startup with the saved snapshot, if any. Bumps the version of
+    whichever data changed, pre-serializes every endpoint, notifies /stream
+    clients and saves live data to SNAPSHOT_FILE. portfolios maps the other
+    accounts to their own holdings=/chart=... changes (an account with none
+    keeps its snapshot; one left out is dropped); only the default portfolio
+    is streamed and saved.
+    """
+    global snapshot
+
+    with publish_lock:
+        if "claude" in changes:
+            changes.setdefault("claude_version", snapshot.claude_version + 1)
+        if "holdings" in changes or "history" in changes:
+            next_portfolio_version(snapshot, changes)
+        if "portfolios" in changes:
+            portfolios = {}
+            for name, account_changes in changes["portfolios"].items():
+                current = snapshot.portfolios.get(name, EMPTY_SNAPSHOT)
+                if not account_changes and name in snapshot.portfolios:
+                    portfolios[name] = current
+                    continue
+                account = current._replace(**next_portfolio_version(current, account_changes))
+                portfolios[name] = account._replace(responses=portfolio_responses(account), chart_sizes=PayloadCache())
+            changes["portfolios"] = portfolios
+
+        new_snapshot = snapshot._replace(**changes)
+        # chart_sizes caches downsampled /chart payloads and deltas for this version only
+        new_snapshot = new_snapshot._replace(responses=build_responses(new_snapshot), chart_sizes=PayloadCache())
+        snapshot = new_snapshot
+
+        if "claude" in changes:
+            broker.publish("claude", new_snapshot.responses["claude"]["body"])
+        if "holdings" in changes:
+            broker.publish("portfolio", new_snapshot.responses["portfolio"]["body"])
+            broker.publish("chart", chart_payload(new_snapshot, components=False, chart_format="columns")["body"])
+
+        if changes.get("claude_stale") is False or changes.get("portfolio_stale") is False:
+            save_snapshot(new_snapshot)
+
+
+def save_snapshot(snap):
+    """Write published data to SNAPSHOT_FILE atomically (temp file + rename)"""
+    saved = {
+        "claude": snap.claude,
+        "claude_version": snap.claude_version,
+        "claude_update": snap.claude_update.isoformat() if snap.claude_update else None,
+        "holdings": table_to_json(snap.holdings) if snap.holdings is not None else None,
+        "chart": table_to_json(snap.chart) if snap.chart is not None else None,
+        "portfolio_version": snap.portfolio_version,
+        "last_update": snap.last_update.isoformat() if snap.last_update else None,
+    }
+
+    temp_file = SNAPSHOT_FILE + ".tmp"
+    try:
+        # One write of the whole document: json.dump would hand gzip thousands of small pieces
+        with gzip.open(temp_file, "wt", encoding="utf-8", compresslevel=GZIP_LEVEL) as f:
+            f.write(json.dumps(saved, separators=(",", ":")))
+        os.replace(temp_file, SNAPSHOT_FILE)
+    except OSError as e:
+        print(f"  Warning: Could not save snapshot: {e}")
+
+
+def table_to_json(table):
+    """A Holdings or Chart namedtuple as plain lists, for SNAPSHOT_FILE"""
+    return {field: value.tolist() if isinstance(value, np.ndarray) else value
+            for field, value in table._asdict().items()}
+
+
+def holdings_from_json(saved):
+    arrays = {field: np.array(saved[field], dtype=float) for field in ("shares", "cost", "current", "previous_close")}
+    return Holdings(**dict(saved, **arrays, stale=np.array(saved["stale"], dtype=bool)))
+
+
+def chart_from_json(saved):
+    components = np.array(saved["components"], dtype=float).reshape(len(saved["t"]), len(saved["symbols"]))
+    return Chart(t=np.array(saved["t"], dtype="<i8"), labels=np.array(saved["labels"], dtype=str),
+                 values=np.array(saved["values"], dtype=float), components=components,
+                 symbols=saved["symbols"], info=saved["info"])
+
+
+def portfolio_snapshot(snap, name):
+    """The Snapshot of the account called name (the default portfolio is snap itself), or None"""
+    return snap if name in (None, DEFAULT_PORTFOLIO) else snap.portfolios.get(name)
+
+
+def load_snapshot():
+    """Read the snapshot saved by a previous run
+
+    Returns:
+        Dict of Snapshot fields marked stale, or {} if there is no usable file
+    """
+    def parse_time(value):
+        return datetime.fromisoformat(value) if value else None
+
+    try:
+        with gzip.open(SNAPSHOT_FILE, "rt", encoding="utf-8") as f:
+            saved = json.load(f)
+
+        restored = {}
+        if saved["claude_update"]:
+            restored.update(
+                claude=saved["claude"],
+                claude_version=saved["claude_version"],
+                claude_update=parse_time(saved["claude_update"]),
+                claude_stale=True,
+            )
+        if saved["holdings"] is not None:
+            restored.update(
+                holdings=holdings_from_json(saved["holdings"]),
+                chart=chart_from_json(saved["chart"]),
+                portfolio_version=saved["portfolio_version"],
+                last_update=parse_time(saved["last_update"]),
+                portfolio_stale=True,
+            )
+        return restored
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"  Warning: Ignoring unreadable snapshot file: {e}")
+        return {}
+
+
+def cached_response(name):
+    """Return a pre-serialized endpoint response from the current snapshot"""
+    return payload_response(snapshot.responses[name])
+
+
+def payload_response(payload):
+    """Return a pre-serialized payload, gzipped if the client accepts it
+
+    Answers 304 Not Modified when a GET or HEAD client already has this
+    version; POSTs (on-demand refreshes) always get the body.
+    """
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    etag = payload["gzip_etag"] if use_gzip else payload["etag"]
+
+    if request.method in ("GET", "HEAD") and not_modified(request.headers, etag, payload["last_modified"]):
+        response = Response(status=304)
+    elif use_gzip:
+        response = Response(payload["gzip"], mimetype=payload["content_type"])
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(payload["body"], mimetype=payload["content_type"])
+
+    response.headers["ETag"] = etag
+    if payload["last_modified"]:
+        response.headers["Last-Modified"] = payload["last_modified"]
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Access-Control-Expose-Headers"] = "ETag, Last-Modified"
+    return response
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    """Count each request, with its latency and body size unless it is a stream"""
+    path = request.url_rule.rule if request.url_rule else "other"
+    metrics.inc("http_requests_total", path=path, status=response.status_code)
+    if not response.is_streamed:
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - g.request_start, path=path)
+        metrics.observe("http_response_bytes", response.content_length or 0, path=path)
+    return response
+
+
+@app.after_request
+def allow_conditional_requests(response):
+    """Answer CORS preflights - the display sends If-None-Match on its polls"""
+    if request.method == "OPTIONS":
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = "If-None-Match, If-Modified-Since"
+        response.headers["Access-Control-Max-Age"] = "86400"
+    return response
+
+
 @app.route('/')
 def index():
     """Root endpoint - shows server status"""
-    return jsonify({
-        "status": "ok",
-        "server": "Car Thing Dashboard Server",
-        "endpoints": ["/claude", "/portfolio", "/chart"],
-        "claude_data": "five_hour" in claude_data,
-        "portfolio_data": portfolio_cache["holdings"] is not None
-    })
+    return cached_response("index")
 
 
 @app.route('/claude')
 @app.route('/usage')
 def get_claude_usage():
     """Endpoint for Claude usage data"""
-    response = jsonify(claude_data)
+    response = cached_response("claude")
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@app.route('/usage/history')
+def get_usage_history():
+    """Claude utilization over time, averaged per USAGE_BUCKET_SECONDS"""
+    response = cached_response("usage_history")
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@app.route('/usage/forecast')
+def get_usage_forecast():
+    """Claude utilization trend and projected time to reach 100% per window"""
+    response = cached_response("usage_forecast")
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def unknown_portfolio():
+    response = payload_response(snapshot.responses["unknown_portfolio"])
+    response.status_code = 404
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
 @app.route('/portfolio')
 @app.route('/holdings')
-def get_portfolio():
-    """Endpoint for portfolio holdings data"""
-    data = portfolio_cache["holdings"] or {"error": "Data not loaded yet"}
-    response = jsonify(data)
+@app.route('/portfolio/<name>')
+def get_portfolio(name=None):
+    """Endpoint for portfolio holdings data (?since=VERSION for only what changed)"""
+    snap = portfolio_snapshot(snapshot, name)
+    if snap is None:
+        return unknown_portfolio()
+    since = since_option(request.query_string.decode())
+    response = payload_response(delta_payload(snap, "portfolio", since) or snap.responses["portfolio"])
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
 @app.route('/chart')
-def get_chart():
-    """Endpoint for intraday chart data"""
-    data = portfolio_cache["chart_data"] or {"error": "Data not loaded yet"}
-    response = jsonify(data)
+@app.route('/chart/<name>')
+def get_chart(name=None):
+    """Endpoint for intraday chart data (?width=N or ?points=N to downsample, ?since=VERSION)"""
+    snap = portfolio_snapshot(snapshot, name)
+    if snap is None:
+        return unknown_portfolio()
+    query = request.query_string.decode()
+    options = chart_options(query)
+    payload = delta_payload(snap, "chart", since_option(query), *options) or chart_payload(snap, *options)
+    response = payload_response(payload)
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
 @app.route('/all')
-def get_all():
-    """Endpoint for all portfolio data (holdings + chart)"""
-    data = {
-        "holdings": portfolio_cache["holdings"],
-        "chart": portfolio_cache["chart_data"],
-        "last_update": portfolio_cache["last_update"].isoformat() if portfolio_cache["last_update"] else None
-    }
-    response = jsonify(data)
+@app.route('/all/<name>')
+def get_all(name=None):
+    """Endpoint for all portfolio data (holdings + chart, ?format=columns for a columnar chart, ?since=VERSION)"""
+    snap = portfolio_snapshot(snapshot, name)
+    if snap is None:
+        return unknown_portfolio()
+    query = request.query_string.decode()
+    chart_format = chart_format_option(query)
+    payload = (delta_payload(snap, "all", since_option(query), chart_format=chart_format)
+               or all_payload(snap, chart_format))
+    response = payload_response(payload)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events stream of Claude, portfolio and chart updates"""
+    response = Response(stream_events(request.headers.get("Last-Event-ID")), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
+@app.route('/schedule')
+def schedule():
+    """Market phase, backoff state and next planned portfolio fetches"""
+    response = payload_response(schedule_payload())
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def refresh_response(source_name, name):
+    """Run an on-demand refresh and return the named response from its snapshot
+
+    Answers 429 with Retry-After when the source was fetched too recently,
+    and 503 when the fetch takes longer than REFRESH_WAIT (it keeps running
+    and publishes as usual when it finishes).
+    """
+    try:
+        _, snap = engine.refresh(source_name).result(timeout=REFRESH_WAIT)
+    except RefreshTooSoon as e:
+        response = Response(status=429)
+        response.headers["Retry-After"] = str(max(1, round(e.retry_after)))
+    except FutureTimeout:
+        response = Response(status=503)
+        response.headers["Retry-After"] = str(SOURCE_RETRY_DELAY)
+    else:
+        response = payload_response(snap.responses[name])
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@app.route('/refresh', methods=['POST'])
+def refresh_portfolio():
+    """Fetch portfolio data now; concurrent callers share one fetch"""
+    return refresh_response("Portfolio", "all")
+
+
+@app.route('/claude/refresh', methods=['POST'])
+def refresh_claude():
+    """Fetch Claude usage now; concurrent callers share one fetch"""
+    return refresh_response("Claude", "claude")
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics: fetch timings, upstream errors and request stats"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
-        "status": "ok",
-        "claude_data": "five_hour" in claude_data,
-        "portfolio_data": portfolio_cache["holdings"] is not None
-    })
+    return cached_response("health")
 
 
 # ============================================================
@@ -406,19 +2781,36 @@ if __name__ == '__main__':
         print("      Edit this file and set ORG_ID and SESSION_KEY")
         print("")
 
-    # Start background fetcher threads
-    claude_thread = threading.Thread(target=fetch_claude_usage_loop, daemon=True)
-    claude_thread.start()
+    print(f"  Tracking {len(accounts[DEFAULT_PORTFOLIO].symbols)} positions")
+    if len(accounts) > 1:
+        print(f"    plus {len(accounts) - 1} more accounts, {len(account_symbols())} symbols in all")
+    print("")
+
+    # Serve the last saved data right away while the first refresh runs
+    publish_snapshot(claude_history=usage_history.series, claude_forecast=usage_history.forecast,
+                     portfolios={name: {} for name in accounts if name != DEFAULT_PORTFOLIO}, **load_snapshot())
+    if snapshot.claude_stale or snapshot.portfolio_stale:
+        print("  Serving saved data until the first refresh")
+        print("")
+    if os.path.exists(HOLDINGS_FILE):
+        print(f"  Holdings from {HOLDINGS_FILE} (reloaded when saved)")
+        print("")
 
-    portfolio_thread = threading.Thread(target=fetch_portfolio_loop, daemon=True)
-    portfolio_thread.start()
+    # Start fetching (every source runs on the engine's event loop)
+    engine.start()
 
     print(f"  Server: http://172.16.42.1:8080")
     print(f"  Endpoints:")
     print(f"    /claude    - Claude usage data")
+    print(f"    /usage/history, /usage/forecast - Claude usage trend")
     print(f"    /portfolio - Portfolio holdings")
-    print(f"    /chart     - Intraday chart data")
+    print(f"    /chart     - Intraday chart (?range=1W/1M/1Y/5Y, ?width=N to downsample)")
     print(f"    /all       - All portfolio data")
+    print(f"    /portfolio/<name>, /chart/<name>, /all/<name> - One account ({', '.join(accounts)})")
+    print(f"    /stream    - Live updates (Server-Sent Events)")
+    print(f"    /schedule  - Market phase and next portfolio fetches")
+    print(f"    /metrics   - Prometheus metrics")
+    print(f"    POST /refresh, /claude/refresh - Fetch now (shared by concurrent callers)")
     print("")
     print("  Press Ctrl+C to stop")
     print("")
@@ -428,10 +2820,10 @@ if __name__ == '__main__':
     print("\nWaiting for initial data...")
     timeout = 60
     start = time.time()
-    while portfolio_cache["holdings"] is None and (time.time() - start) < timeout:
+    while snapshot.holdings is None and (time.time() - start) < timeout:
         time.sleep(1)
 
-    if portfolio_cache["holdings"] is None:
+    if snapshot.holdings is None:
         print("Warning: Portfolio data still loading, starting server anyway...")
 
     print("\n" + "-"*50)
@@ -7,6 +7,11 @@ Created by Eli Gorelick - eligorelick.com
 
 from flask import Flask, jsonify
 from curl_cffi import requests
+from collections import deque
+from datetime import datetime, timezone
+import json
+import os
+import random
 import threading
 import time
 
@@ -37,55 +42,368 @@ SESSION_KEY = "YOUR_SESSION_KEY_HERE"
 
 # How often to fetch from Claude API (in seconds)
 # Default: 300 (5 minutes) - this won't affect your usage limits
+# This is the baseline: polls speed up while 5-hour usage is climbing
+# and slow down while it is flat.
 FETCH_INTERVAL = 300
+MIN_INTERVAL = 60        # Fastest polling, while usage is climbing
+MAX_INTERVAL = 1800      # Slowest polling, while usage is flat
+BACKOFF_MAX = 3600       # Longest wait after repeated failures
+RESET_GRACE = 5          # Seconds after a cached resets_at to poll again
+REQUEST_TIMEOUT = 20     # Seconds to wait for the usage endpoint
+
+# Usage endpoint - can point at a local fake endpoint for testing
+USAGE_URL = f"https://claude.ai/api/organizations/{ORG_ID}/usage"
+
+# Usage history (/usage/history, /usage/forecast), kept across restarts in USAGE_LOG_FILE
+USAGE_LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage_history.jsonl")
+USAGE_HISTORY_SIZE = 2016     # Samples kept in memory (a week of 5-minute polls)
+USAGE_HISTORY_BUCKETS = 672   # /usage/history points (a week of 15-minute buckets)
+USAGE_BUCKET_SECONDS = 900    # /usage/history resolution
+USAGE_FORECAST_WINDOW = 3600  # Seconds of samples behind each /usage/forecast trend
+
+
+class UsagePoller:
+    """Polls the Claude usage endpoint over one long-lived HTTP session
+
+    The curl_cffi session keeps its connection (and Chrome impersonation)
+    alive between polls and sends If-None-Match, so an unchanged payload can
+    come back as a bodyless 304. After each poll next_delay() picks the wait:
+
+    - five_hour utilization climbing: often enough to see ~4 polls before
+      it would reach 100% at the current rate (not below MIN_INTERVAL)
+    - flat: 1.5x longer each time, up to MAX_INTERVAL
+    - failure (401/403/5xx/network): exponential backoff with jitter
+    - never past a cached resets_at time, so a reset shows up right away
+    """
+
+    WINDOWS = ("five_hour", "seven_day", "seven_day_sonnet")
+
+    def __init__(self, url, session_key, base_interval):
+        self.url = url
+        self.session_key = session_key
+        self.base_interval = base_interval
+        self.interval = base_interval
+        self.session = None
+        self.etag = None
+        self.data = None
+        self.last_sample = None  # (time, five_hour utilization)
+        self.resets = {}         # window -> resets_at as epoch seconds
+        self.failures = 0
+
+    def _open_session(self):
+        session = requests.Session(impersonate="chrome")
+        session.headers.update({
+            "Cookie": f"sessionKey={self.session_key}",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Accept": "application/json",
+        })
+        return session
+
+    def _close_session(self):
+        if self.session is not None:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+            self.session = None
+
+    def poll(self):
+        """Fetch usage once
+
+        Returns:
+            The usage dict (the previous one on 304), or {"error": message}
+        """
+        timestamp = time.strftime('%H:%M:%S')
+        print(f"[{timestamp}] Fetching usage from Claude.ai...")
+
+        try:
+            if self.session is None:
+                self.session = self._open_session()
+            headers = {"If-None-Match": self.etag} if self.etag else {}
+            response = self.session.get(self.url, headers=headers, timeout=REQUEST_TIMEOUT)
+            usage_data = response.json() if response.status_code == 200 else None
+            if response.status_code == 200 and not isinstance(usage_data, dict):
+                raise ValueError(f"Unexpected response body: {type(usage_data).__name__}")
+        except Exception as e:
+            print(f"[{timestamp}] ERROR: {e}")
+            # Start over with a fresh connection next time
+            self._close_session()
+            self.failures += 1
+            return {"error": str(e)}
+
+        if response.status_code == 304 and self.data is not None:
+            print(f"[{timestamp}] Unchanged since last fetch")
+            self._record(self.data)
+            return self.data
+
+        if response.status_code == 200:
+            self.etag = response.headers.get("ETag")
+            self._record(usage_data)
+            five_hour = (usage_data.get('five_hour') or {}).get('utilization', 'N/A')
+            seven_day = (usage_data.get('seven_day') or {}).get('utilization', 'N/A')
+            sonnet = (usage_data.get('seven_day_sonnet') or {}).get('utilization', 'N/A')
+            print(f"[{timestamp}] SUCCESS!")
+            print(f"           5-Hour: {five_hour}% | 7-Day: {seven_day}% | Sonnet: {sonnet}%")
+            return usage_data
+
+        self.failures += 1
+        if response.status_code == 401:
+            print(f"[{timestamp}] ERROR: Session expired - get new SESSION_KEY from browser")
+            return {"error": "Session expired - update SESSION_KEY"}
+        if response.status_code == 403:
+            print(f"[{timestamp}] ERROR: Access denied - check your credentials")
+            return {"error": "Access denied - check credentials"}
+        print(f"[{timestamp}] ERROR: HTTP {response.status_code}")
+        return {"error": f"HTTP {response.status_code}"}
+
+    def _record(self, data):
+        """Update the adaptive interval and cached reset times from a good response"""
+        now = time.time()
+        self.data = data
+        self.failures = 0
+
+        for window in self.WINDOWS:
+            resets_at = (data.get(window) or {}).get("resets_at")
+            try:
+                self.resets[window] = datetime.fromisoformat(resets_at.replace("Z", "+00:00")).timestamp()
+            except (AttributeError, ValueError):
+                self.resets.pop(window, None)
+
+        utilization = (data.get("five_hour") or {}).get("utilization")
+        if not isinstance(utilization, (int, float)):
+            self.interval = self.base_interval
+            return
+
+        if self.last_sample is not None and now > self.last_sample[0]:
+            rate = (utilization - self.last_sample[1]) / (now - self.last_sample[0])
+            if rate > 0:
+                seconds_to_limit = max(0, 100 - utilization) / rate
+                self.interval = max(MIN_INTERVAL, min(self.base_interval, seconds_to_limit / 4))
+            elif rate == 0:
+                self.interval = min(MAX_INTERVAL, self.interval * 1.5)
+            else:
+                self.interval = self.base_interval
+        self.last_sample = (now, utilization)
+
+    def next_delay(self):
+        """Seconds to wait before the next poll"""
+        if self.failures:
+            ceiling = min(BACKOFF_MAX, self.base_interval * 2 ** (self.failures - 1))
+            return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+        delay = self.interval
+        upcoming = [t - time.time() for t in self.resets.values() if t > time.time()]
+        if upcoming:
+            delay = min(delay, min(upcoming) + RESET_GRACE)
+        return max(MIN_INTERVAL / 4, delay)
+
+
+class RollingRegression:
+    """Least-squares line through the samples from the last `window` seconds
+
+    Keeps running sums, so adding a sample and evicting the expired ones
+    costs O(1) per sample instead of refitting the whole window.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        self.points = deque()
+        self.origin = None  # x values are stored relative to this to keep the sums small
+        self.n = self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def _update(self, x, y, sign):
+        self.n += sign
+        self.sx += sign * x
+        self.sy += sign * y
+        self.sxx += sign * x * x
+        self.sxy += sign * x * y
+
+    def add(self, t, y):
+        if self.origin is None:
+            self.origin = t
+        x = t - self.origin
+        self.points.append((x, y))
+        self._update(x, y, 1)
+        while self.points[0][0] < x - self.window:
+            self._update(*self.points.popleft(), -1)
+
+    def slope(self):
+        """Units per second, or None with fewer than two distinct sample times"""
+        denominator = self.n * self.sxx - self.sx ** 2
+        if self.n < 2 or denominator <= 1e-9:
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+
+class UsageHistory:
+    """Utilization samples for each usage window, in memory and on disk
+
+    The last USAGE_HISTORY_SIZE samples sit in a ring buffer, and every new
+    one is appended to USAGE_LOG_FILE (one JSON object per line), which is
+    replayed on startup. The /usage/history buckets and the rolling
+    regressions behind /usage/forecast are updated as each sample arrives,
+    so `series` and `forecast` are always ready and never rescan the log.
+    """
+
+    WINDOWS = ("five_hour", "seven_day", "seven_day_sonnet")
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.samples = deque(maxlen=USAGE_HISTORY_SIZE)
+        self.buckets = deque(maxlen=USAGE_HISTORY_BUCKETS)
+        self.bucket_start = None
+        self.bucket_sums = {}  # window -> [sum, count] for the newest bucket
+        self.trends = {window: RollingRegression(USAGE_FORECAST_WINDOW) for window in self.WINDOWS}
+        self.latest = {}       # window -> (utilization, resets_at)
+        self.logged = 0
+        self.series = {"bucket_seconds": USAGE_BUCKET_SECONDS, "points": []}
+        self.forecast = {}
+        self._load()
+
+    def _load(self):
+        # Replay only the newest USAGE_HISTORY_SIZE lines, but count them all so
+        # a log that has grown past the limit is compacted on the next write
+        lines = deque(maxlen=USAGE_HISTORY_SIZE)
+        logged = 0
+        try:
+            with open(self.log_file, encoding="utf-8") as f:
+                for line in f:
+                    lines.append(line)
+                    logged += 1
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Warning: Could not read usage history: {e}")
+            return
+
+        for line in lines:
+            try:
+                self._add(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue  # Torn or hand-edited line
+        self.logged = logged
+        self._publish()
+
+    def add(self, data, now=None):
+        """Record one poll's usage data (ignored if it has no utilization values)"""
+        sample = {"t": now or time.time()}
+        for window in self.WINDOWS:
+            entry = data.get(window) or {}
+            if isinstance(entry.get("utilization"), (int, float)):
+                sample[window] = entry["utilization"]
+                sample[window + "_resets_at"] = entry.get("resets_at")
+        if len(sample) == 1:
+            return
+
+        self._add(sample)
+        self._log(sample)
+        self._publish()
+
+    def _add(self, sample):
+        t = sample["t"]
+        self.samples.append(sample)
+
+        # Running average per USAGE_BUCKET_SECONDS bucket
+        start = t - t % USAGE_BUCKET_SECONDS
+        if start != self.bucket_start:
+            self.buckets.append(None)
+            self.bucket_start = start
+            self.bucket_sums = {}
+
+        bucket = {"t": datetime.fromtimestamp(start, timezone.utc).isoformat()}
+        for window in self.WINDOWS:
+            if window not in sample:
+                continue
+            utilization = sample[window]
+            sums = self.bucket_sums.setdefault(window, [0.0, 0])
+            sums[0] += utilization
+            sums[1] += 1
+
+            # A drop means the window reset; the old trend no longer applies
+            previous = self.latest.get(window, (None, None))[0]
+            if previous is not None and utilization < previous:
+                self.trends[window].clear()
+            self.trends[window].add(t, utilization)
+            self.latest[window] = (utilization, sample.get(window + "_resets_at"))
+
+        for window, (total, count) in self.bucket_sums.items():
+            bucket[window] = round(total / count, 2)
+        self.buckets[-1] = bucket
+
+    def _log(self, sample):
+        try:
+            if self.logged >= 2 * USAGE_HISTORY_SIZE:
+                # Compact: rewrite the log with just the ring buffer
+                temp_file = self.log_file + ".tmp"
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(s) + "\n" for s in self.samples)
+                os.replace(temp_file, self.log_file)
+                self.logged = len(self.samples)
+            else:
+                with open(self.log_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(sample) + "\n")
+                self.logged += 1
+        except OSError as e:
+            print(f"Warning: Could not write usage history: {e}")
+
+    def _publish(self):
+        """Rebuild the series and forecast dicts (swapped in whole for readers)"""
+        now = self.samples[-1]["t"] if self.samples else time.time()
+        self.series = {
+            "bucket_seconds": USAGE_BUCKET_SECONDS,
+            "points": list(self.buckets),
+        }
+
+        forecast = {}
+        for window in self.WINDOWS:
+            if window not in self.latest:
+                continue
+            utilization, resets_at = self.latest[window]
+            rate = self.trends[window].slope()
+            entry = {
+                "utilization": utilization,
+                "rate_per_hour": round(rate * 3600, 3) if rate is not None else None,
+                "full_at": None,
+                "hours_to_full": None,
+                "resets_at": resets_at,
+                "resets_first": None,
+            }
+            if rate and rate > 0:
+                seconds = max(0.0, 100 - utilization) / rate
+                entry["full_at"] = datetime.fromtimestamp(now + seconds, timezone.utc).isoformat()
+                entry["hours_to_full"] = round(seconds / 3600, 2)
+                try:
+                    reset = datetime.fromisoformat(resets_at.replace("Z", "+00:00")).timestamp()
+                    entry["resets_first"] = reset < now + seconds
+                except (AttributeError, ValueError):
+                    pass
+            forecast[window] = entry
+
+        self.forecast = {"window_seconds": USAGE_FORECAST_WINDOW, "windows": forecast}
+
+
+poller = UsagePoller(USAGE_URL, SESSION_KEY, FETCH_INTERVAL)
+usage_history = UsageHistory(USAGE_LOG_FILE)
 
 
 def fetch_usage_loop():
     """Background thread that continuously fetches usage data"""
     global usage_data
-    
+
     print("\n" + "="*50)
     print("Starting usage fetcher...")
     print("="*50 + "\n")
-    
+
     while True:
         try:
-            timestamp = time.strftime('%H:%M:%S')
-            print(f"[{timestamp}] Fetching usage from Claude.ai...")
-            
-            response = requests.get(
-                f"https://claude.ai/api/organizations/{ORG_ID}/usage",
-                headers={
-                    "Cookie": f"sessionKey={SESSION_KEY}",
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                    "Accept": "application/json",
-                },
-                impersonate="chrome"
-            )
-            
-            if response.status_code == 200:
-                usage_data = response.json()
-                five_hour = usage_data.get('five_hour', {}).get('utilization', 'N/A')
-                seven_day = usage_data.get('seven_day', {}).get('utilization', 'N/A')
-                sonnet = usage_data.get('seven_day_sonnet', {}).get('utilization', 'N/A')
-                print(f"[{timestamp}] SUCCESS!")
-                print(f"           5-Hour: {five_hour}% | 7-Day: {seven_day}% | Sonnet: {sonnet}%")
-            elif response.status_code == 401:
-                print(f"[{timestamp}] ERROR: Session expired - get new SESSION_KEY from browser")
-                usage_data = {"error": "Session expired - update SESSION_KEY"}
-            elif response.status_code == 403:
-                print(f"[{timestamp}] ERROR: Access denied - check your credentials")
-                usage_data = {"error": "Access denied - check credentials"}
-            else:
-                print(f"[{timestamp}] ERROR: HTTP {response.status_code}")
-                usage_data = {"error": f"HTTP {response.status_code}"}
-                
+            usage_data = poller.poll()
+            usage_history.add(usage_data)
         except Exception as e:
-            timestamp = time.strftime('%H:%M:%S')
-            print(f"[{timestamp}] ERROR: {e}")
-            usage_data = {"error": str(e)}
-        
-        time.sleep(FETCH_INTERVAL)
+            print(f"[{time.strftime('%H:%M:%S')}] ERROR: {e}")
+        time.sleep(poller.next_delay())
 
 
 @app.route('/')
@@ -97,6 +415,22 @@ def get_usage():
     return response
 
 
+@app.route('/usage/history')
+def get_usage_history():
+    """Utilization over time, averaged per USAGE_BUCKET_SECONDS"""
+    response = jsonify(usage_history.series)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@app.route('/usage/forecast')
+def get_usage_forecast():
+    """Utilization trend and projected time to reach 100% per window"""
+    response = jsonify(usage_history.forecast)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
@@ -140,7 +474,7 @@ if __name__ == '__main__':
     fetcher.start()
     
     print(f"  Server: http://172.16.42.1:8080")
-    print(f"  Fetch interval: {FETCH_INTERVAL} seconds")
+    print(f"  Fetch interval: {FETCH_INTERVAL} seconds (adaptive, {MIN_INTERVAL}-{MAX_INTERVAL}s)")
     print("")
     print("  Press Ctrl+C to stop")
     print("")
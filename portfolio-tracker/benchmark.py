@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+"""
+Portfolio Server Benchmark
+Times the fetch, aggregate and serve paths of a server with no network:
+Yahoo Finance and the Claude usage endpoint are replaced by fixtures, and
+the holdings by synthetic portfolios of the requested sizes.
+
+For each portfolio size it times fetch_portfolio_data() (first and repeat
+runs), fetch_intraday_charts(), revaluing one symbol's quote, building the
+serialized responses and reloading an edited holdings file, then load tests
+each endpoint like loadtest.py.
+A memory report compares bytes per symbol-day of intraday bars held as
+JSON-style dicts and as arrays. Results are written as JSON so runs can be
+compared.
+
+Fixtures are read from --fixtures. If the file doesn't exist, seeded
+synthetic fixtures are generated and saved there, so later runs replay the
+same data. --record saves real quotes, bars and Claude usage for the
+server's HOLDINGS instead (this one needs the network).
+
+Examples:
+    python benchmark.py
+    python benchmark.py --sizes 10 100 --duration 5 --output before.json
+    python benchmark.py --server "../claude-carthingand portfolio-final/carthing_server.py"
+    python benchmark.py --record --fixtures recorded.json.gz
+"""
+
+import argparse
+import contextlib
+import gc
+import gzip
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from loadtest import client_loop, percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Bars kept per interval, in the same units as the servers' CHART_RANGES
+FIXTURE_DAYS = {"30m": 7, "1h": 31, "1d": 5 * 366}
+FIXTURE_INTERVALS = {"5m": 300, "30m": 1800, "1h": 3600, "1d": 86400}
+SESSION_OPEN = 9.5 * 3600    # 09:30 market time, seconds after midnight
+SESSION_LENGTH = 6.5 * 3600
+
+DEFAULT_PATHS = {
+    "portfolio": ["/", "/chart", "/chart?width=300&format=columns", "/chart?range=1Y&width=300",
+                  "/all", "/health"],
+    "flask": ["/claude", "/portfolio", "/chart", "/chart?width=300&format=columns",
+              "/all", "/usage/history", "/health"],
+}
+
+
+def load_server(path, name):
+    """Import a server module from its file path under a fresh module name"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+#
+# {"quotes": {symbol: {"regularMarketPrice", "regularMarketPreviousClose"}},
+#  "bars": {interval: {symbol: [[offset, close], ...]}},
+#  "claude": usage response}
+#
+# 5m offsets are seconds after the session open; other intervals store the
+# bar's age in seconds, so replayed history always ends just before now.
+# ---------------------------------------------------------------------------
+
+def synthetic_fixtures(count, seed):
+    """Seeded random-walk quotes and bars for `count` symbols"""
+    rng = np.random.default_rng(seed)
+    fixtures = {"quotes": {}, "bars": {interval: {} for interval in FIXTURE_INTERVALS}}
+
+    for i in range(count):
+        symbol = f"FX{i:03d}"
+        price = float(rng.uniform(10, 500))
+
+        for interval, step in FIXTURE_INTERVALS.items():
+            if interval == "5m":
+                offsets = np.arange(0, SESSION_LENGTH, step)
+            elif interval == "1d":
+                offsets = np.arange(FIXTURE_DAYS[interval], 0, -1) * 86400
+            else:
+                days = np.arange(FIXTURE_DAYS[interval], 0, -1) * 86400
+                offsets = (days[:, None] - np.arange(0, SESSION_LENGTH, step)[None, :]).ravel()
+            walk = price * np.exp(np.cumsum(rng.normal(0, 0.002, len(offsets))))
+            fixtures["bars"][interval][symbol] = [[int(o), round(float(c), 2)] for o, c in zip(offsets, walk)]
+
+        session = fixtures["bars"]["5m"][symbol]
+        fixtures["quotes"][symbol] = {
+            "regularMarketPrice": session[-1][1],
+            "regularMarketPreviousClose": fixtures["bars"]["1d"][symbol][-1][1],
+        }
+
+    fixtures["claude"] = {
+        "five_hour": {"utilization": 42.0, "resets_at": "2099-01-01T00:00:00Z"},
+        "seven_day": {"utilization": 17.0, "resets_at": "2099-01-07T00:00:00Z"},
+        "seven_day_sonnet": {"utilization": 5.0, "resets_at": "2099-01-07T00:00:00Z"},
+    }
+    return fixtures
+
+
+def record_fixtures(server):
+    """Fetch real quotes, bars and (if configured) Claude usage for the server's HOLDINGS"""
+    symbols = list(server.HOLDINGS)
+    now = time.time()
+    fixtures = {"quotes": {}, "bars": {}}
+
+    payload = server._get_quote_json(symbols)
+    for quote in payload["quoteResponse"]["result"]:
+        fixtures["quotes"][quote["symbol"]] = {
+            "regularMarketPrice": quote.get("regularMarketPrice"),
+            "regularMarketPreviousClose": quote.get("regularMarketPreviousClose") or quote.get("previousClose"),
+        }
+
+    for interval in FIXTURE_INTERVALS:
+        window = {"period": "1d"} if interval == "5m" else {"period": f"{FIXTURE_DAYS[interval]}d"}
+        closes = server.download_closes(symbols, interval=interval, **window)
+        index = closes.index if closes.index.tz is not None else closes.index.tz_localize(server.MARKET_TIMEZONE)
+        index = index.tz_convert(server.MARKET_TIMEZONE)
+        if interval == "5m":
+            midnight = index.normalize()
+            offsets = (index - midnight).total_seconds() - SESSION_OPEN
+        else:
+            offsets = now - (index - pd.Timestamp(0, tz="UTC")).total_seconds()
+        fixtures["bars"][interval] = {
+            symbol: [[int(o), float(c)] for o, c in zip(offsets, closes[symbol]) if pd.notna(c)]
+            for symbol in symbols
+        }
+
+    poller = getattr(server, "claude_poller", None)
+    claude = poller.poll() if poller is not None else {}
+    fixtures["claude"] = claude if "error" not in claude else {}
+    return fixtures
+
+
+def load_fixtures(path):
+    with gzip.open(path, "rt") as f:
+        return json.load(f)
+
+
+def save_fixtures(fixtures, path):
+    with gzip.open(path, "wt") as f:
+        json.dump(fixtures, f)
+
+
+class FixtureUpstream:
+    """Stands in for Yahoo Finance using fixtures, scaled out to any portfolio size
+
+    Portfolio symbol i replays the fixtures of base symbol i % len(bases).
+    Every request can be delayed by `latency` seconds to mimic the network.
+    """
+
+    def __init__(self, fixtures, size, market_timezone, latency=0.0):
+        self.fixtures = fixtures
+        self.market_timezone = market_timezone
+        self.latency = latency
+        bases = sorted(fixtures["quotes"])
+        self.symbols = [f"S{i:04d}" for i in range(size)]
+        self.base = {symbol: bases[i % len(bases)] for i, symbol in enumerate(self.symbols)}
+        self.requests = 0
+
+    def holdings(self):
+        return {symbol: {"shares": 1 + i % 50, "cost_per_share": round(self.quote(symbol)["current"] * 0.9, 2)}
+                for i, symbol in enumerate(self.symbols)}
+
+    def _wait(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def quote(self, symbol):
+        quote = self.fixtures["quotes"][self.base[symbol]]
+        return {"current": quote["regularMarketPrice"], "previous_close": quote["regularMarketPreviousClose"]}
+
+    def get_quote_json(self, symbols):
+        """Replaces _get_quote_json()"""
+        self._wait()
+        result = []
+        for symbol in symbols:
+            if symbol in self.base:
+                result.append(dict(self.fixtures["quotes"][self.base[symbol]], symbol=symbol))
+        return {"quoteResponse": {"result": result}}
+
+    def fetch_quote(self, symbol):
+        """Replaces fetch_quote()"""
+        self._wait()
+        return self.quote(symbol)
+
+    def download_closes(self, symbols, interval="1d", start=None, **kwargs):
+        """Replaces download_closes(): a time-indexed frame with a column per symbol"""
+        self._wait()
+        now = pd.Timestamp.now(tz=self.market_timezone)
+        columns = {}
+        for symbol in symbols:
+            bars = np.array(self.fixtures["bars"][interval].get(self.base.get(symbol), []), dtype=float).reshape(-1, 2)
+            if interval == "5m":
+                times = now.normalize() + pd.to_timedelta(SESSION_OPEN + bars[:, 0], unit="s")
+            else:
+                times = now - pd.to_timedelta(bars[:, 0], unit="s")
+            columns[symbol] = pd.Series(bars[:, 1], index=pd.DatetimeIndex(times))
+
+        frame = pd.DataFrame(columns).reindex(columns=symbols).sort_index()
+        if start is not None:
+            frame = frame[frame.index >= pd.Timestamp(start)]
+        return frame
+
+
+def serve_claude_fixture(usage):
+    """Serve the Claude usage fixture over local HTTP; returns (server, url)"""
+    body = json.dumps(usage).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/usage"
+
+
+def install_fixtures(server, upstream, workdir, claude_url=None):
+    """Point a freshly imported server module at the fixtures and a scratch directory"""
+    server.HOLDINGS = upstream.holdings()
+    server.PORTFOLIOS = {}
+    server.accounts = server.build_accounts()
+    server.valuations = {name: server.Valuation(account) for name, account in server.accounts.items()}
+    server._get_quote_json = upstream.get_quote_json
+    server.fetch_quote = upstream.fetch_quote
+    server.download_closes = upstream.download_closes
+    # Always take the in-session path, whatever the wall clock says
+    server.market_phase = lambda now=None: "regular"
+
+    server.SNAPSHOT_FILE = os.path.join(workdir, "snapshot.json.gz")
+    server.HOLDINGS_FILE = os.path.join(workdir, "holdings.json")
+    server.bar_store = server.IntradayBarStore()
+    server.price_history = server.PriceHistoryStore(os.path.join(workdir, "price_history"))
+    server.last_price_data.clear()
+
+    if claude_url and hasattr(server, "claude_poller"):
+        server.claude_poller = server.UsagePoller(claude_url, "benchmark", server.CLAUDE_FETCH_INTERVAL)
+        server.usage_history = server.UsageHistory(os.path.join(workdir, "usage_history.jsonl"))
+
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+def summarize(times):
+    """min/p50/p99/max of a list of seconds, in milliseconds"""
+    ms = sorted(t * 1000 for t in times)
+    return {"runs": len(ms), "min_ms": round(ms[0], 3), "p50_ms": round(percentile(ms, 50), 3),
+            "p99_ms": round(percentile(ms, 99), 3), "max_ms": round(ms[-1], 3)}
+
+
+def time_calls(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def publish(server, result):
+    """carthing_server fetchers return a FetchResult for the engine to publish"""
+    if hasattr(result, "changes") and result.changes:
+        server.publish_snapshot(**result.changes)
+    return result
+
+
+def time_stages(server, repeat):
+    """Time each fetch/aggregate/serialize stage with the fixtures installed"""
+    stages = {}
+    symbols = list(server.HOLDINGS)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # The first run downloads full sessions and history; later ones only new bars
+        cold = time_calls(lambda: publish(server, server.fetch_portfolio_data()), 1)
+        warm = time_calls(lambda: publish(server, server.fetch_portfolio_data()), repeat)
+        stages["fetch_portfolio_data"] = dict(summarize(warm), cold_ms=round(cold[0] * 1000, 3))
+
+        price_data = server.fetch_quotes(symbols)
+        stages["fetch_intraday_charts"] = summarize(time_calls(
+            lambda: server.fetch_intraday_charts(symbols, price_data, refresh=True), repeat))
+
+        if hasattr(server, "fetch_claude_usage"):
+            stages["fetch_claude_usage"] = summarize(time_calls(
+                lambda: publish(server, server.fetch_claude_usage()), repeat))
+
+        # One symbol ticking: revalue just that position, then take a Holdings snapshot
+        valuation = server.valuations[server.DEFAULT_PORTFOLIO]
+        symbol = symbols[len(symbols) // 2]
+        quote = dict(price_data[symbol])
+        ticks = itertools.count()
+
+        def tick():
+            quote["current"] = price_data[symbol]["current"] + next(ticks) % 100 / 100
+            valuation.update(symbol, quote)
+        stages["quote_update"] = summarize(time_calls(tick, repeat))
+        stages["valuation_holdings"] = summarize(time_calls(valuation.holdings, repeat))
+
+        snap = server.snapshot
+        stages["build_responses"] = summarize(time_calls(lambda: server.build_responses(snap), repeat))
+
+        # Array-backed model: JSON dicts are built at the serialization edge
+        def build_json():
+            return {"holdings": server.holdings_json(snap.holdings), "chart": server.chart_json(snap.chart)}
+        stages["build_json"] = summarize(time_calls(build_json, repeat))
+        data = build_json()
+        stages["json_dumps"] = summarize(time_calls(lambda: json.dumps(data), repeat))
+
+        # Edit one position in the holdings file: re-valued from cached quotes and bars, nothing fetched
+        holdings = {symbol: dict(position) for symbol, position in server.HOLDINGS.items()}
+        edited = symbols[len(symbols) // 3]
+        edits = itertools.count()
+
+        def reload():
+            holdings[edited]["shares"] = 1 + next(edits) % 100
+            with open(server.HOLDINGS_FILE, "w") as f:
+                json.dump({"holdings": holdings, "cash": server.CASH, "money_market": server.MONEY_MARKET}, f)
+            publish(server, server.reload_holdings())
+            # carthing_server rebuilds multi-day charts on its next holdings check
+            if getattr(server, "history_pending", None):
+                publish(server, server.rebuild_history_charts())
+        stages["holdings_reload"] = summarize(time_calls(reload, repeat))
+
+    return stages
+
+
+def start_http(server):
+    """Serve the module's endpoints on an ephemeral local port; returns (httpd, port)"""
+    if hasattr(server, "app"):
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)  # No per-request log lines
+        httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+        port = httpd.server_port
+    else:
+        httpd = server.PortfolioServer(("127.0.0.1", 0), server.PortfolioHandler)
+        port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, port
+
+
+def load_test(port, paths, args):
+    """Run loadtest.py's client loop against each path in turn"""
+    results = {}
+    for path in paths:
+        run_args = argparse.Namespace(host="127.0.0.1", port=port, paths=[path], timeout=args.timeout,
+                                      keepalive=True, gzip=args.gzip)
+        deadline = time.perf_counter() + args.duration
+        per_client = [[] for _ in range(args.clients)]
+        threads = [threading.Thread(target=client_loop, args=(run_args, deadline, samples))
+                   for samples in per_client]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        samples = [sample for client in per_client for sample in client]
+        latencies = sorted(s[1] * 1000 for s in samples if s[2])
+        results[path] = {
+            "requests": len(samples),
+            "errors": sum(1 for s in samples if not s[2]),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "max_ms": round(latencies[-1] if latencies else 0, 3),
+        }
+    return results
+
+
+def benchmark_size(args, fixtures, size, claude_url):
+    server = load_server(args.server, f"benchmarked_server_{size}")
+    with tempfile.TemporaryDirectory() as workdir:
+        upstream = FixtureUpstream(fixtures, size, server.MARKET_TIMEZONE, args.latency / 1000)
+        install_fixtures(server, upstream, workdir, claude_url)
+
+        stages = time_stages(server, args.repeat)
+        result = {"symbols": size, "stages": stages, "upstream_requests": upstream.requests}
+
+        if args.duration > 0:
+            paths = args.paths or DEFAULT_PATHS["flask" if hasattr(server, "app") else "portfolio"]
+            httpd, port = start_http(server)
+            try:
+                result["http"] = load_test(port, paths, args)
+            finally:
+                httpd.shutdown()
+
+    return result
+
+
+def retained_bytes(build):
+    """Bytes still allocated once build() returns, as seen by tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+def memory_report(server, sizes, bars):
+    """Bytes per symbol-day of `bars` intraday bars, and per position, as JSON dicts vs arrays
+
+    The dict form is what chart_json() and holdings_json() produce, which
+    is also how the servers held this data before the array-backed model.
+    """
+    rows = []
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        symbols = [f"S{i:04d}" for i in range(size)]
+        open_time = pd.Timestamp.now(tz=server.MARKET_TIMEZONE).normalize() + pd.Timedelta(seconds=SESSION_OPEN)
+        times = open_time + pd.to_timedelta(np.arange(bars) * 60, unit="s")
+        components = rng.uniform(100, 1000, (bars, size)).round(2)
+
+        def build_chart():
+            return server.Chart(t=server.epoch_seconds(times), labels=np.array(times.strftime("%H:%M"), dtype=str),
+                                values=components.sum(axis=1), components=components.copy(),
+                                symbols=list(symbols), info={"previous_close": 0.0})
+        chart = build_chart()
+
+        prices = {symbol: {"current": float(p), "previous_close": float(p) * 0.99}
+                  for symbol, p in zip(symbols, rng.uniform(10, 500, size))}
+        valuation = server.Valuation(server.Positions({symbol: {"shares": 1 + i % 50, "cost_per_share": 100.0}
+                                                       for i, symbol in enumerate(symbols)}))
+        valuation.apply(prices)
+        holdings = valuation.holdings()
+
+        rows.append({
+            "symbols": size,
+            "bars_per_day": bars,
+            "dict_bytes_per_symbol_day": round(retained_bytes(lambda: server.chart_json(chart)) / size),
+            "array_bytes_per_symbol_day": round(retained_bytes(build_chart) / size),
+            "dict_bytes_per_position": round(retained_bytes(lambda: server.holdings_json(holdings)["positions"]) / size),
+            "array_bytes_per_position": round(retained_bytes(valuation.holdings) / size),
+        })
+    return rows
+
+
+def print_result(result):
+    print(f"\n{result['symbols']} symbols ({result['upstream_requests']} upstream requests)")
+    print(f"  {'stage':<22} {'cold ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'min ms':>9}")
+    for name, stage in result["stages"].items():
+        cold = f"{stage['cold_ms']:>9.2f}" if "cold_ms" in stage else f"{'':>9}"
+        print(f"  {name:<22} {cold} {stage['p50_ms']:>9.2f} {stage['p99_ms']:>9.2f} {stage['min_ms']:>9.2f}")
+
+    if "http" in result:
+        print(f"  {'endpoint':<34} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9}")
+        for path, row in result["http"].items():
+            print(f"  {path:<34} {row['rps']:>9.1f} {row['errors']:>7} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+
+
+def print_memory(rows):
+    print(f"\nMemory ({rows[0]['bars_per_day']} bars per day)")
+    print(f"  {'symbols':>8} {'dict B/sym-day':>15} {'array B/sym-day':>16} {'dict B/pos':>11} {'array B/pos':>12}")
+    for row in rows:
+        print(f"  {row['symbols']:>8} {row['dict_bytes_per_symbol_day']:>15} {row['array_bytes_per_symbol_day']:>16} "
+              f"{row['dict_bytes_per_position']:>11} {row['array_bytes_per_position']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a dashboard server offline")
+    parser.add_argument("--server", default=os.path.join(HERE, "portfolio_server.py"),
+                        help="server module to benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="synthetic portfolio sizes (symbols)")
+    parser.add_argument("--fixtures", default=os.path.join(HERE, "benchmark_fixtures.json.gz"),
+                        help="fixture file (created with seeded data if missing)")
+    parser.add_argument("--record", action="store_true",
+                        help="record real upstream responses into --fixtures and exit")
+    parser.add_argument("--seed", type=int, default=1, help="seed for generated fixtures")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per stage")
+    parser.add_argument("--latency", type=float, default=0, help="simulated ms per upstream request")
+    parser.add_argument("--paths", nargs="+", help="endpoints to load test (default depends on server)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients per endpoint")
+    parser.add_argument("--duration", type=float, default=3, help="seconds per endpoint (0 skips HTTP)")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout")
+    parser.add_argument("--gzip", action="store_true", help="send Accept-Encoding: gzip")
+    parser.add_argument("--memory-bars", type=int, default=390,
+                        help="bars per day for the memory report (390 = 1-minute bars)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    args = parser.parse_args()
+
+    if args.record:
+        fixtures = record_fixtures(load_server(args.server, "recorded_server"))
+        save_fixtures(fixtures, args.fixtures)
+        print(f"Recorded {len(fixtures['quotes'])} symbols to {args.fixtures}")
+        return
+
+    if not os.path.exists(args.fixtures):
+        save_fixtures(synthetic_fixtures(20, args.seed), args.fixtures)
+        print(f"Generated fixtures in {args.fixtures} (seed {args.seed})")
+    fixtures = load_fixtures(args.fixtures)
+
+    claude_server, claude_url = serve_claude_fixture(fixtures.get("claude") or {})
+    print(f"Benchmarking {os.path.basename(args.server)} with {args.fixtures}")
+
+    results = []
+    try:
+        for size in args.sizes:
+            results.append(benchmark_size(args, fixtures, size, claude_url))
+            print_result(results[-1])
+    finally:
+        claude_server.shutdown()
+
+    server = load_server(args.server, "memory_server")
+    memory = memory_report(server, args.sizes, args.memory_bars)
+    print_memory(memory)
+
+    report = {
+        "server": os.path.basename(args.server),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fixtures": os.path.basename(args.fixtures),
+        "settings": {key: getattr(args, key) for key in
+                     ("sizes", "repeat", "latency", "clients", "duration", "gzip")},
+        "results": results,
+        "memory": memory,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Portfolio Server Load Test
+Hits the server's endpoints from several concurrent clients and reports
+requests per second and p50/p99 latency per endpoint.
+
+Run it against the server before and after a change to compare. Use --idle
+to hold some connections open without sending anything (like a stalled
+display), which shows whether other requests keep being served.
+
+Examples:
+    python loadtest.py
+    python loadtest.py --host 127.0.0.1 --clients 20 --duration 15
+    python loadtest.py --paths /all /health --idle 2 --no-keepalive
+"""
+
+import argparse
+import http.client
+import socket
+import threading
+import time
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def client_loop(args, deadline, samples):
+    """One simulated display: request the paths in turn until the deadline"""
+    conn = None
+    i = 0
+
+    while time.perf_counter() < deadline:
+        path = args.paths[i % len(args.paths)]
+        i += 1
+
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(args.host, args.port, timeout=args.timeout)
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"} if args.gzip else {})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 500
+            if not args.keepalive or response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            ok = False
+            if conn is not None:
+                conn.close()
+                conn = None
+
+        samples.append((path, time.perf_counter() - start, ok))
+
+    if conn is not None:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the portfolio server")
+    parser.add_argument("--host", default="172.16.42.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--paths", nargs="+", default=["/all", "/health"])
+    parser.add_argument("--clients", type=int, default=10, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout")
+    parser.add_argument("--idle", type=int, default=0, help="extra connections held open doing nothing")
+    parser.add_argument("--gzip", action="store_true", help="send Accept-Encoding: gzip")
+    parser.add_argument("--no-keepalive", dest="keepalive", action="store_false",
+                        help="open a new connection for every request")
+    args = parser.parse_args()
+
+    print(f"Load testing http://{args.host}:{args.port} for {args.duration:g}s "
+          f"({args.clients} clients, {args.idle} idle, keep-alive {'on' if args.keepalive else 'off'})")
+
+    idle = [socket.create_connection((args.host, args.port)) for _ in range(args.idle)]
+
+    deadline = time.perf_counter() + args.duration
+    per_client = [[] for _ in range(args.clients)]
+    threads = [threading.Thread(target=client_loop, args=(args, deadline, samples))
+               for samples in per_client]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    for sock in idle:
+        sock.close()
+
+    samples = [sample for client in per_client for sample in client]
+
+    print()
+    print(f"{'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for path in args.paths + ["total"]:
+        rows = [s for s in samples if path == "total" or s[0] == path]
+        latencies = sorted(s[1] * 1000 for s in rows if s[2])
+        errors = sum(1 for s in rows if not s[2])
+        print(f"{path:<12} {len(rows):>9} {errors:>7} {len(rows) / elapsed:>9.1f} "
+              f"{percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f} "
+              f"{(latencies[-1] if latencies else 0):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()